@@ -0,0 +1,99 @@
+import time
+import numpy as np
+import pyaudio
+
+class PCMRingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # Every sample is stored twice, at i and i + capacity, so any window of up to capacity samples is one contiguous slice.
+        self._samples = np.zeros(2 * capacity, dtype=np.int16)
+        self.written = 0
+
+    def write(self, samples):
+        # Single writer, the audio callback. Readers only look below self.written, which moves after the samples land.
+        count = len(samples)
+        if count > self.capacity:
+            self.written += count - self.capacity
+            samples = samples[-self.capacity:]
+            count = self.capacity
+
+        start = self.written % self.capacity
+        first = min(count, self.capacity - start)
+        self._samples[start:start + first] = samples[:first]
+        self._samples[start + self.capacity:start + self.capacity + first] = samples[:first]
+        if first < count:
+            rest = count - first
+            self._samples[:rest] = samples[first:]
+            self._samples[self.capacity:self.capacity + rest] = samples[first:]
+        self.written += count
+
+    def oldest(self):
+        return max(0, self.written - self.capacity)
+
+    def view(self, start, end):
+        # Zero-copy and read-only; valid until capacity more samples have been written.
+        if start < self.oldest() or end > self.written or end - start > self.capacity:
+            raise ValueError(f"samples {start}-{end} are not in the buffer")
+        offset = start % self.capacity
+        view = self._samples[offset:offset + end - start]
+        view.flags.writeable = False
+        return view
+
+class AudioCapture:
+    def __init__(self, microphone, capacity_seconds=120):
+        self.microphone = microphone
+        self.ring = PCMRingBuffer(int(capacity_seconds * microphone.rate))
+        self.stream = None
+        self.overflows = 0
+
+    @property
+    def written(self):
+        return self.ring.written
+
+    @property
+    def active(self):
+        return self.stream is not None
+
+    def start(self):
+        if self.stream is not None:
+            return
+        m = self.microphone
+        self.stream = m.p.open(format=m.format,
+                               channels=m.channels,
+                               rate=m.rate,
+                               input=True,
+                               frames_per_buffer=m.chunk,
+                               stream_callback=self._callback)
+        self.stream.start_stream()
+
+    def stop(self):
+        if self.stream is None:
+            return
+        stream = self.stream
+        self.stream = None
+        stream.stop_stream()
+        stream.close()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if status & pyaudio.paInputOverflow:
+            self.overflows += 1
+        self.ring.write(np.frombuffer(in_data, dtype=np.int16))
+        return (None, pyaudio.paContinue)
+
+    def wait_for(self, position, timeout=1.0):
+        # Polls rather than waiting on a lock so the callback never blocks on a reader.
+        deadline = time.time() + timeout
+        interval = self.microphone.chunk / self.microphone.rate / 2
+        while self.ring.written < position:
+            if self.stream is None or time.time() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
+
+    def view(self, start, end):
+        return self.ring.view(start, end)
+#
+#
+#
+#
+#
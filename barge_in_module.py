@@ -0,0 +1,60 @@
+import numpy as np
+import webrtcvad
+from tracing_module import tracer
+
+class BargeInMonitor:
+    def __init__(self, microphone, speaker, mode='stop', min_speech=0.15, echo_ratio=0.5, min_level=300, duck_gain=0.2, pre_roll=0.3):
+        self.microphone = microphone
+        self.speaker = speaker
+        self.mode = mode
+        self.min_speech = min_speech
+        # Speech only counts while it is clearly louder than what the speaker is putting into the room.
+        self.echo_ratio = echo_ratio
+        self.min_level = min_level
+        self.duck_gain = duck_gain
+        self.pre_roll = pre_roll
+        # Separate from the microphone's detector, which the recording thread uses.
+        self.vad = webrtcvad.Vad(3)
+
+    def is_user_speech(self, frame):
+        level = float(np.sqrt(np.mean(frame.astype(np.float32) ** 2)))
+        if level < max(self.min_level, self.echo_ratio * self.speaker.playback_level()):
+            return False
+        return self.vad.is_speech(memoryview(frame).cast('B'), self.microphone.rate)
+
+    def watch(self, stop_event):
+        # Runs while Ioanna speaks. Returns the ring position the user's speech starts at, or None.
+        m = self.microphone
+        capture = m.capture
+        needed = max(1, int(self.min_speech * m.rate / m.chunk))
+        position = capture.written
+        run = 0
+        run_start = position
+
+        while not stop_event.is_set() and capture.active:
+            end = position + m.chunk
+            if not capture.wait_for(end, timeout=0.1):
+                continue
+            if self.is_user_speech(capture.view(position, end)):
+                if run == 0:
+                    run_start = position
+                run += 1
+            else:
+                run = 0
+            position = end
+
+            if run >= needed:
+                if self.mode == 'duck':
+                    self.speaker.duck(self.duck_gain)
+                else:
+                    self.speaker.interrupt()
+                delay = (capture.written - run_start) / m.rate
+                tracer.observe('barge_in.latency', delay)
+                print(f"barge-in: user started speaking {delay * 1000:.0f} ms ago, {'ducking' if self.mode == 'duck' else 'stopping'} playback")
+                return max(capture.ring.oldest(), run_start - int(self.pre_roll * m.rate))
+        return None
+#
+#
+#
+#
+#
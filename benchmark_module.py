@@ -0,0 +1,119 @@
+import argparse
+import json
+import resource
+import sys
+import time
+from collections import defaultdict
+import numpy as np
+from registry_module import registry
+from replay_module import LatencyProfile, Replay, Session
+from tracing_module import tracer
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    values = np.array(samples) * 1000
+    return {
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max()),
+        'count': len(samples),
+    }
+
+def run_benchmark(session_path, runs=3, latency=None, speed=1.0):
+    session = Session.load(session_path)
+    samples = defaultdict(list)
+
+    def collect(name, seconds):
+        samples[name].append(seconds)
+
+    enabled, output_dir = tracer.enabled, tracer.output_dir
+    tracer.enabled = True
+    tracer.output_dir = None
+    tracer.reset()
+    tracer.subscribe(collect)
+
+    wall_start = time.perf_counter()
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        for run in range(runs):
+            print(f"Replay {run + 1}/{runs}")
+            Replay(session, latency, speed).run()
+    finally:
+        tracer.unsubscribe(collect)
+        tracer.enabled, tracer.output_dir = enabled, output_dir
+        # The replays leave models and fakes loaded for each other; release them once all runs are done.
+        registry.close()
+
+    wall = time.perf_counter() - wall_start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (usage.ru_utime - usage_start.ru_utime) + (usage.ru_stime - usage_start.ru_stime)
+
+    return {
+        'runs': runs,
+        'turns': percentiles(samples.pop('turn', [])),
+        'stages': {name: percentiles(values) for name, values in sorted(samples.items())},
+        'wall_seconds': wall,
+        'cpu_seconds': cpu,
+        'cpu_percent': 100 * cpu / wall if wall else 0.0,
+        # ru_maxrss is in kilobytes on Linux.
+        'peak_rss_mb': usage.ru_maxrss / 1024,
+    }
+
+def print_report(results):
+    turns = results['turns']
+    print("-----")
+    if turns:
+        print(f"turn latency over {turns['count']} turns: p50 {turns['p50']:.0f} ms, p90 {turns['p90']:.0f} ms, p99 {turns['p99']:.0f} ms, max {turns['max']:.0f} ms")
+    print(f"{'stage':<40} {'count':>6} {'p50 ms':>9} {'p90 ms':>9} {'max ms':>9}")
+    for name, stage in results['stages'].items():
+        print(f"{name:<40} {stage['count']:>6} {stage['p50']:>9.1f} {stage['p90']:>9.1f} {stage['max']:>9.1f}")
+    print(f"cpu: {results['cpu_seconds']:.1f} s over {results['wall_seconds']:.1f} s wall ({results['cpu_percent']:.0f}%)")
+    print(f"peak memory: {results['peak_rss_mb']:.0f} MB")
+
+def regressions(results, baseline, tolerance=0.2):
+    # Anything whose p50 grew by more than the tolerance compared to the baseline run.
+    found = []
+    pairs = [('turn', results['turns'], baseline.get('turns', {}))]
+    pairs += [(name, stage, baseline.get('stages', {}).get(name, {})) for name, stage in results['stages'].items()]
+    for name, current, previous in pairs:
+        if current and previous and previous['p50'] > 0 and current['p50'] > previous['p50'] * (1 + tolerance):
+            found.append(f"{name}: p50 {previous['p50']:.1f} ms -> {current['p50']:.1f} ms")
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded session against local fakes and report latency.")
+    parser.add_argument('session')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--speed', type=float, default=1.0, help="replay speed; 2 plays audio and video twice as fast")
+    parser.add_argument('--no-latency', action='store_true', help="fake backends answer immediately")
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--baseline', help="fail if p50 latencies regressed against this results file")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    latency = LatencyProfile.none() if args.no_latency else LatencyProfile()
+    results = run_benchmark(args.session, args.runs, latency, args.speed)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found = regressions(results, json.load(baseline_file), args.tolerance)
+        for regression in found:
+            print(f"regression: {regression}")
+        if found:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+#
+#
+#
+#
+#
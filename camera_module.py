@@ -2,102 +2,292 @@ import cv2
 import time
 import dlib
 import numpy as np
-from google.cloud import vision
-from google.api_core.exceptions import ServiceUnavailable
-from threading import Lock
+from collections import OrderedDict
+from threading import Lock, Thread
+from frame_buffer_module import FrameBuffer
+from emotion_backend_module import GoogleVisionEmotionBackend, LocalEmotionBackend
+from registry_module import FACE_RECOGNITION_MODEL, SHAPE_PREDICTOR, registry
+from tracing_module import tracer
+
+# dlib's HOG detector scans an 80x80 window, so it cannot find faces smaller than this in the image it is given.
+HOG_WINDOW = 80
+
+class FaceAnalysis:
+    def __init__(self, sequence, timestamp, frame, gray, box):
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.frame = frame
+        self.gray = gray
+        self.box = box
+        self.shape = None
+        self.landmarks = None
+
+    @property
+    def found(self):
+        return self.box is not None
+
+    def crop(self, padding=0.25):
+        if self.box is None:
+            return None
+        height, width = self.gray.shape
+        pad_x = int(self.box.width() * padding)
+        pad_y = int(self.box.height() * padding)
+        top = max(0, self.box.top() - pad_y)
+        bottom = min(height, self.box.bottom() + pad_y)
+        left = max(0, self.box.left() - pad_x)
+        right = min(width, self.box.right() + pad_x)
+        return self.frame[top:bottom, left:right]
 
 class CameraModule:
-    def __init__(self, credentials_path='./resources/gcp_vision_credentials.json'):
+    def __init__(self, credentials_path='./resources/gcp_vision_credentials.json', emotion_backend='local'):
         self.cap = None
-        self.detector = dlib.get_frontal_face_detector()
-        self.sp = dlib.shape_predictor('./resources/shape_predictor_68_face_landmarks.dat')
-        self.facerec = dlib.face_recognition_model_v1('./resources/dlib_face_recognition_resnet_model_v1.dat')
-        self.client = vision.ImageAnnotatorClient.from_service_account_json(credentials_path)
+        self.camera_index = 0
+        self.capture_factory = cv2.VideoCapture
+        if emotion_backend == 'google':
+            self.emotion_backend = GoogleVisionEmotionBackend(credentials_path)
+        else:
+            self.emotion_backend = LocalEmotionBackend(self)
+        self.emotion_batch_size = 8
+        # Frames wider than this are shrunk before detection, but never so far that a face of min_face_size is lost.
+        self.detection_width = 640
+        self.analysis_cache = OrderedDict()
+        self.analysis_cache_size = 32
+        self.analysis_lock = Lock()
+        self.min_face_size = 80
+        self.min_face_sharpness = 60.0
+        self.tracking = True
+        self.detection_interval = 10
+        self.tracking_threshold = 7.0
+        self.tracker = None
+        self.tracker_sequence = None
+        self.frames_since_detection = 0
+        self.tracker_lock = Lock()
         self.face_detected = False
-        self.last_emotion_detection_time = 0
         self.frame_lock = Lock()
-        self.current_frame = None
+        self.frame_buffer = FrameBuffer()
+        self.capture_thread = None
+        self.capturing = False
+
+    @property
+    def detector(self):
+        return registry.get('face_detector')
+
+    @property
+    def sp(self):
+        return registry.get('shape_predictor', SHAPE_PREDICTOR)
+
+    @property
+    def facerec(self):
+        return registry.get('face_recognition_model', FACE_RECOGNITION_MODEL)
 
     def start_camera(self):
-        if self.cap is None:
-            self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            raise IOError("cannot open webcam!")
+        with self.frame_lock:
+            if self.cap is None:
+                self.cap = self.capture_factory(self.camera_index)
+            if not self.cap.isOpened():
+                raise IOError("cannot open webcam!")
+
+            if self.capture_thread is None:
+                self.capturing = True
+                self.capture_thread = Thread(target=self.capture_frames, daemon=True)
+                self.capture_thread.start()
+
+    def capture_frames(self):
+        # The only reader of the device; everyone else reads from the frame buffer.
+        while self.capturing:
+            ret, frame = self.cap.read()
+            if ret:
+                self.frame_buffer.publish(frame, time.time())
+            else:
+                time.sleep(0.01)
+
+    def analyze(self, entry):
+        # One grayscale conversion and one detection per frame, shared by every consumer.
+        sequence, timestamp, frame = entry
+        with self.analysis_lock:
+            analysis = self.analysis_cache.get(sequence)
+            if analysis is not None:
+                self.analysis_cache.move_to_end(sequence)
+                return analysis
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        box = self.track_face(sequence, gray) if self.tracking else self.locate_face(gray)
+        analysis = FaceAnalysis(sequence, timestamp, frame, gray, box)
+
+        if sequence is not None:
+            with self.analysis_lock:
+                self.analysis_cache[sequence] = analysis
+                while len(self.analysis_cache) > self.analysis_cache_size:
+                    self.analysis_cache.popitem(last=False)
+        return analysis
+
+    def track_face(self, sequence, gray):
+        # Full detection every detection_interval frames or when the correlation tracker loses confidence.
+        with self.tracker_lock:
+            if sequence is None or (self.tracker_sequence is not None and sequence <= self.tracker_sequence):
+                return self.locate_face(gray)
+
+            if self.tracker is not None and self.frames_since_detection < self.detection_interval:
+                confidence = self.tracker.update(gray)
+                if confidence >= self.tracking_threshold:
+                    self.tracker_sequence = sequence
+                    self.frames_since_detection += 1
+                    position = self.tracker.get_position()
+                    height, width = gray.shape
+                    box = dlib.rectangle(
+                        max(0, int(position.left())),
+                        max(0, int(position.top())),
+                        min(width - 1, int(position.right())),
+                        min(height - 1, int(position.bottom())),
+                    )
+                    if box.width() > 0 and box.height() > 0:
+                        return box
+
+            box = self.locate_face(gray)
+            self.tracker_sequence = sequence
+            self.frames_since_detection = 0
+            if box is None:
+                self.tracker = None
+            else:
+                self.tracker = dlib.correlation_tracker()
+                self.tracker.start_track(gray, box)
+            return box
+
+    def detection_scale(self, width):
+        return min(1.0, max(self.detection_width / width, HOG_WINDOW / self.min_face_size))
+
+    def locate_face(self, gray):
+        height, width = gray.shape
+        scale = self.detection_scale(width)
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale != 1 else gray
+        faces = self.detector(small)
+        if len(faces) == 0:
+            return None
+
+        face = max(faces, key=lambda rect: rect.area())
+        return dlib.rectangle(
+            max(0, int(face.left() / scale)),
+            max(0, int(face.top() / scale)),
+            min(width - 1, int(face.right() / scale)),
+            min(height - 1, int(face.bottom() / scale)),
+        )
+
+    def face_shape(self, analysis):
+        if analysis.box is None:
+            return None
+        if analysis.shape is None:
+            analysis.shape = self.sp(analysis.gray, analysis.box)
+        return analysis.shape
+
+    def face_landmarks(self, analysis):
+        if analysis.landmarks is None:
+            shape = self.face_shape(analysis)
+            if shape is None:
+                return None
+            analysis.landmarks = np.array([(point.x, point.y) for point in shape.parts()], dtype=np.float32)
+        return analysis.landmarks
 
     def detect_face(self):
-        frame = self.get_current_frame()
-        if frame is not None:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.detector(gray)
-            self.face_detected = len(faces) > 0
+        entry = self.get_latest_frame()
+        if entry is not None:
+            self.face_detected = self.analyze(entry).found
         return self.face_detected
 
-    def perform_face_encoding(self, frame):
-        if frame is None:
+    def face_sharpness(self, analysis):
+        if analysis.box is None:
+            return 0.0
+        box = analysis.box
+        face = analysis.gray[box.top():box.bottom(), box.left():box.right()]
+        if face.size == 0:
+            return 0.0
+        # Variance of the Laplacian: low values mean a blurry face.
+        return float(cv2.Laplacian(face, cv2.CV_64F).var())
+
+    def face_quality(self, analysis):
+        if analysis.box is None or min(analysis.box.width(), analysis.box.height()) < self.min_face_size:
+            return 0.0
+        return self.face_sharpness(analysis)
+
+    @tracer.traced('camera.collect_face_descriptors')
+    def collect_face_descriptors(self, count=5, timeout=5.0):
+        frames = []
+        shapes = []
+        # Faces that missed the size or sharpness gate, kept in case too few good frames arrive.
+        rejected = []
+        last_sequence = 0
+        deadline = time.time() + timeout
+
+        def add(analysis):
+            detections = dlib.full_object_detections()
+            detections.append(self.face_shape(analysis))
+            frames.append(analysis.frame)
+            shapes.append(detections)
+
+        while len(frames) < count and time.time() < deadline:
+            entry = self.wait_for_frame(last_sequence, timeout=0.5)
+            if entry is None:
+                continue
+            last_sequence = entry[0]
+
+            analysis = self.analyze(entry)
+            if self.face_quality(analysis) < self.min_face_sharpness:
+                if analysis.found:
+                    rejected.append((self.face_sharpness(analysis), analysis))
+                    rejected = sorted(rejected, key=lambda candidate: candidate[0], reverse=True)[:count]
+                continue
+            add(analysis)
+
+        # Better a descriptor from a small or soft face than asking the user to sit still forever.
+        for _, analysis in rejected[:count - len(frames)]:
+            add(analysis)
+
+        if not frames:
             return None
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.detector(gray)
-        if len(faces) > 0:
-            shape = self.sp(gray, faces[0])
-            face_descriptor = self.facerec.compute_face_descriptor(frame, shape)
-            return np.array(face_descriptor).tolist()
-        return None
+
+        # One batched pass through the recognition network for every collected frame.
+        descriptors = self.facerec.compute_face_descriptor(frames, shapes)
+        return np.array([np.array(faces[0]) for faces in descriptors], dtype=np.float32)
 
     def get_current_frame(self):
-        with self.frame_lock:
-            if self.cap is None or not self.cap.isOpened():
-                return None
-            ret, frame = self.cap.read()
-            if ret:
-                self.current_frame = frame
-            return self.current_frame
-
-    def detect_emotion(self, frame):
-        current_time = time.time()
-        if current_time - self.last_emotion_detection_time >= 0.5:
-            success, encoded_image = cv2.imencode('.jpg', frame)
-            if success:
-                image_content = encoded_image.tobytes()
-                image = vision.Image(content=image_content)
-
-                retries = 3
-                for attempt in range(retries):
-                    try:
-                        response = self.client.face_detection(image=image)
-                        face_annotations = response.face_annotations
-                        if face_annotations:
-                            face = face_annotations[0]
-                            emotions = {
-                                'anger': face.anger_likelihood,
-                                'joy': face.joy_likelihood,
-                                'sorrow': face.sorrow_likelihood,
-                                'surprise': face.surprise_likelihood,
-                            }
-                            likelihood_name = ('UNKNOWN', 'VERY_UNLIKELY', 'UNLIKELY', 'POSSIBLE', 'LIKELY', 'VERY_LIKELY')
-                            likelihood_values = {
-                                'UNKNOWN': 0,
-                                'VERY_UNLIKELY': 1,
-                                'UNLIKELY': 2,
-                                'POSSIBLE': 3,
-                                'LIKELY': 4,
-                                'VERY_LIKELY': 5,
-                            }
-                            emotion_texts = [f"{emotion}: {likelihood_values[likelihood_name[emotions[emotion]]]}" for emotion in emotions]
-                            self.last_emotion_detection_time = current_time
-                            return emotion_texts
-                        break
-                    except ServiceUnavailable as e:
-                        print(f"service unavailable, retrying ({attempt+1}/{retries})!")
-                        time.sleep(1)
-                    except Exception as e:
-                        print(f"an error occurred: {str(e)}!")
-                        break
-        return None
+        entry = self.frame_buffer.latest()
+        if entry is None:
+            return None
+        return entry[2]
+
+    def get_latest_frame(self):
+        return self.frame_buffer.latest()
+
+    def get_frame_at(self, timestamp, tolerance=None):
+        return self.frame_buffer.closest(timestamp, tolerance)
+
+    def get_frames_between(self, start_time, end_time):
+        return self.frame_buffer.between(start_time, end_time)
+
+    def wait_for_frame(self, after_sequence, timeout=1.0):
+        return self.frame_buffer.wait_for_next(after_sequence, timeout)
+
+    @tracer.traced('camera.detect_emotions')
+    def detect_emotions(self, entries):
+        if not entries:
+            return []
+        results = self.emotion_backend.detect_batch([self.analyze(entry) for entry in entries])
+        return [(emotions, timestamp) for (_, timestamp, _), emotions in zip(entries, results) if emotions]
 
     def stop_camera(self):
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None
+        with self.frame_lock:
+            self.capturing = False
+            if self.capture_thread is not None:
+                self.capture_thread.join()
+                self.capture_thread = None
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
+            self.frame_buffer.clear()
+            with self.analysis_lock:
+                self.analysis_cache.clear()
+            with self.tracker_lock:
+                self.tracker = None
+                self.tracker_sequence = None
 #
 #
 #
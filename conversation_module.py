@@ -3,10 +3,17 @@ from camera_module import CameraModule
 from speaker_module import SpeakerModule
 from microphone_module import MicrophoneModule
 from ioanna_module import Ioanna
-import spacy
-from pymongo import MongoClient
-import numpy as np
-import threading
+from face_index_module import FaceIndex
+from orchestrator_module import FACE_NOT_RECOGNIZED, GREETING, SYSTEM_PHRASES, WELCOME_BACK, ConversationOrchestrator
+from persistence_module import PersistenceQueue, migrate_embedded_memories
+from memory_retrieval_module import MemoryIndex
+from registry_module import registry
+from nlp_module import NLPService
+from tracing_module import tracer
+from barge_in_module import BargeInMonitor
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from bson import ObjectId
+import os
 import time
 import datetime
 from threading import Lock
@@ -30,63 +37,43 @@ class ConversationModule(QThread):
     conversation_updated = pyqtSignal(list)
     new_message = pyqtSignal(dict)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, mongo_client=None):
         super().__init__(parent)
         self.camera = CameraModule()
         self.speaker = SpeakerModule()
         self.microphone = MicrophoneModule()
-        self.mongo_client = MongoClient("")
+        self.mongo_client = mongo_client if mongo_client is not None else MongoClient("")
         self.db = self.mongo_client.ioanna_1
         self.users_collection = self.db.users
-        self.nlp = spacy.load("en_core_web_sm")
-        self.emotions = []
-        self.emotion_detection_active = False
-        self.emotion_lock = Lock()
+        self.memories_collection = self.db.memories
+        self.persistence = PersistenceQueue()
+        self.recent_memories = 500
+        self.memory_index = MemoryIndex()
+        self.face_index = FaceIndex(self.users_collection)
+        self.face_samples = 5
+        self.face_exemplars = 5
+        # How far from the middle of a sentence a camera frame may be taken and still stand for it.
+        self.frame_match_tolerance = 0.25
+        self.nlp = NLPService()
+        # Full duplex: the microphone stays open while Ioanna speaks and the user can cut in.
+        # IOANNA_DUPLEX=1 stops her when they do, IOANNA_DUPLEX=duck only turns her down.
+        duplex = os.environ.get('IOANNA_DUPLEX', '')
+        self.duplex = duplex in ('1', 'duck')
+        self.barge_in = BargeInMonitor(self.microphone, self.speaker, mode='duck' if duplex == 'duck' else 'stop')
         self.running = True
         self.run_lock = Lock()
+        # Replays run several conversations in one process and keep the loaded models and provided fakes between them.
+        self.close_registry = True
 
         api_key = ""
         self.conversation_history = ThreadSafeConversationHistory()
-        self.ioanna = Ioanna(api_key, follow_up_limit=1, conversation_history=self.conversation_history)
+        self.ioanna = Ioanna(api_key, follow_up_limit=1, conversation_history=self.conversation_history, memory_index=self.memory_index)
+        self.system_phrases = SYSTEM_PHRASES
+        self.orchestrator = ConversationOrchestrator(self)
 
     def run(self):
         try:
-            print("-----")
-            self.camera.start_camera()
-            current_user = self.get_current_user()
-
-            goodbye_phrase = "goodbye"
-
-            while self.is_running():
-
-                question = self.ioanna.get_question(current_user)
-                self.conversation_history.append({'role': 'assistant', 'content': question})
-                self.new_message.emit({'role': 'assistant', 'content': question})
-                self.speaker.synthesize_speech(question)
-
-                recording_started = time.time()
-                processed_emotions, sentences, transcript = self.record_audio_and_facial_emotions()
-                self.conversation_history.append({'role': 'user', 'content': transcript})
-                self.new_message.emit({'role': 'user', 'content': transcript})
-
-                matched_data = self.match_facial_emotions_to_sentences(processed_emotions, sentences, recording_started)
-                merged_sentences = self.merge_emotion_data(sentences, matched_data)
-                self.print_merge_details(merged_sentences)
-
-                print("-----")
-                details = self.memorise_sentences(merged_sentences)
-
-                user = self.add_to_user_memories(current_user, question, details)
-                self.users_collection.update_one({'user_name': user['user_name']}, {'$set': user})
-
-                self.speaker.delete_tts_output()
-                self.microphone.delete_audio_files()
-                print("-----")
-
-                if goodbye_phrase in transcript.lower():
-                    break
-
-            self.speaker.synthesize_speech("Goodbye!")
+            self.orchestrator.run()
         except Exception as e:
             print(f"An error occurred in the conversation module: {str(e)}")
         finally:
@@ -103,7 +90,12 @@ class ConversationModule(QThread):
     def cleanup(self):
         print("cleaning up resources.")
         self.camera.stop_camera()
+        self.persistence.close()
         self.mongo_client.close()
+        self.microphone.close()
+        self.speaker.close()
+        if self.close_registry:
+            registry.close()
         self.finished.emit(True)
 
     def get_current_user(self):
@@ -124,128 +116,138 @@ class ConversationModule(QThread):
         print("-----")
         self.face_detected_signal.emit(True)
 
-        face_encoding = None
-        while face_encoding is None and self.is_running():
-            frame = self.camera.get_current_frame()
-            face_encoding = self.camera.perform_face_encoding(frame)
-            if face_encoding is None:
+        descriptors = None
+        while descriptors is None and self.is_running():
+            descriptors = self.camera.collect_face_descriptors(self.face_samples)
+            if descriptors is None:
                 print("unable to obtain face encoding, retrying!")
-                self.speaker.synthesize_speech("i couldn't recognize your face, please try again!")
+                self.speaker.synthesize_speech(FACE_NOT_RECOGNIZED)
                 time.sleep(1)
 
         if not self.is_running():
             return None
 
+        print(f"Collected {len(descriptors)} face descriptors")
+        face_encoding = descriptors.mean(axis=0).tolist()
         match_found, user = self.check_face_encoding(face_encoding)
 
         if match_found:
-            greeting = f"Welcome back!"
+            greeting = WELCOME_BACK
             print(greeting)
             self.speaker.synthesize_speech(greeting)
         else:
-            greeting = "Hello there, I am Ioanna! What is your name?"
+            greeting = GREETING
             print(greeting)
             self.speaker.synthesize_speech(greeting)
 
-            file_name = 'output.wav'
-            self.microphone.record(file_name)
-            transcript = self.microphone.transcribe_and_analyze(file_name)[0]
+            _, result = self.microphone.listen()
+            transcript = result.transcript if result is not None else ""
 
             user_name = self.get_user_name(transcript)
             print(f"user_name: {user_name}")
 
             user = {
                 'face_encoding': face_encoding,
-                'user_name': user_name,
-                'memories': []
+                'face_exemplars': descriptors[:self.face_exemplars].tolist(),
+                'user_name': user_name
             }
 
             self.add_user_to_database(user)
-
+            user['memories'] = []
+            self.memory_index.reset()
         return user
 
     def get_user_name(self, text):
-        doc = self.nlp(text)
-        for ent in doc.ents:
-            if ent.label_ == "PERSON":
-                return ent.text
-        return None
+        return self.nlp.person_name(text)
 
+    @tracer.traced('conversation.check_face_encoding')
     def check_face_encoding(self, face_encoding):
         if face_encoding is None:
             print("Error: face encoding is None.")
             return False, None
 
-        match_found = False
-        user = None
+        user_id, distance = self.face_index.match(face_encoding)
+        if user_id is None:
+            print(f"No matching face found (closest distance: {distance})")
+            return False, None
+
+        user = self.users_collection.find_one({'_id': user_id}, {'face_exemplars': 0})
+        if user is None:
+            return False, None
+
+        print(f"Matched face with distance: {distance:.3f}")
+        self.migrate_embedded_memories(user)
+        user['memories'] = self.load_memories(user)
+        self.memory_index.reset(user['memories'])
+        return True, user
 
-        all_faces = self.users_collection.find()
-        for stored_face in all_faces:
-            stored_encoding = np.array(stored_face['face_encoding'])
-            dist = np.linalg.norm(np.array(face_encoding) - stored_encoding)
-            if dist < 0.6:
-                match_found = True
-                user = stored_face
-                break
+    def ensure_indexes(self):
+        self.memories_collection.create_index([('user_id', ASCENDING), ('created_at', DESCENDING)])
+        self.users_collection.create_index('user_name')
 
-        return match_found, user
+    def load_memories(self, user, limit=None):
+        cursor = self.memories_collection.find(
+            {'user_id': user['_id']},
+            {'_id': 0, 'question': 1, 'answers': 1, 'created_at': 1}
+        ).sort('created_at', DESCENDING).limit(limit or self.recent_memories)
+        return list(reversed(list(cursor)))
+
+    def migrate_embedded_memories(self, user):
+        count = migrate_embedded_memories(self.users_collection, self.memories_collection, user)
+        if count:
+            print(f"Moved {count} memories into the memories collection")
 
     def add_user_to_database(self, user):
         try:
-            result = self.users_collection.insert_one(user)
-            print(f"User added to database with ID: {result.inserted_id}")
+            # Written behind; the in-memory user is already usable for the rest of the session.
+            user.setdefault('_id', ObjectId())
+            self.persistence.insert(self.users_collection, dict(user))
+            self.face_index.add(user['_id'], user['face_encoding'], user.get('face_exemplars', []))
+            print(f"User queued for database with ID: {user['_id']}")
         except Exception as e:
             print(f"Error adding user to database: {e}")
 
-    def record_audio_and_facial_emotions(self):
-        file_name = 'output.wav'
-        with self.emotion_lock:
-            self.emotions = []
-            self.emotion_detection_active = True
-
-        def capture_emotions():
-            while self.emotion_detection_active and self.is_running():
-                frame = self.camera.get_current_frame()
-                if frame is not None:
-                    emotions = self.camera.detect_emotion(frame)
-                    if emotions:
-                        with self.emotion_lock:
-                            emotion_dict = {}
-                            for emotion in emotions:
-                                name, value = emotion.split(': ')
-                                emotion_dict[name] = int(value)
-                            self.emotions.append((emotion_dict, time.time()))
-                time.sleep(0.1)
-
-        emotion_thread = threading.Thread(target=capture_emotions)
-        emotion_thread.start()
-
-        if not self.microphone.is_recording_active():
-            self.microphone.record(file_name)
-
-        with self.emotion_lock:
-            self.emotion_detection_active = False
-        emotion_thread.join()
-
-        transcript, sentences = self.microphone.transcribe_and_analyze(file_name)
-
-        with self.emotion_lock:
-            facial_emotions = []
-            for emotion_dict, timestamp in self.emotions:
-                facial_emotions.append((emotion_dict, timestamp))
-
-        print("Emotions detected during recording:")
-        for emotions, timestamp in facial_emotions:
-            print(f"{emotions} at {timestamp}")
-        print("-----")
-
-        return facial_emotions, sentences, transcript
+    def capture_facial_emotions(self, stop_event):
+        facial_emotions = []
+        batch = []
+        interval = max(0.1, self.camera.emotion_backend.min_interval)
+        last_sequence = 0
+        last_sampled = 0
+
+        while not stop_event.is_set() and self.is_running():
+            entry = self.camera.wait_for_frame(last_sequence, timeout=interval)
+            if entry is None:
+                continue
+            last_sequence = entry[0]
+            if entry[1] - last_sampled < interval:
+                continue
+            last_sampled = entry[1]
+
+            batch.append(entry)
+            if len(batch) >= self.camera.emotion_batch_size:
+                facial_emotions.extend(self.camera.detect_emotions(batch))
+                batch = []
+
+        facial_emotions.extend(self.camera.detect_emotions(batch))
+        return facial_emotions
+
+    def sentence_frame_emotions(self, facial_emotions, sentences, start_time):
+        # Short sentences can fall between two sampled frames; those get the frame taken nearest their middle.
+        sampled = [timestamp - start_time for _, timestamp in facial_emotions]
+        entries = {}
+        for sentence, audio_segment, duration, sentiment, audio_emotion, sentence_start_time in sentences:
+            sentence_end_time = sentence_start_time + duration / 1000.0
+            if any(sentence_start_time <= timestamp <= sentence_end_time for timestamp in sampled):
+                continue
+            entry = self.camera.get_frame_at(start_time + (sentence_start_time + sentence_end_time) / 2, self.frame_match_tolerance)
+            if entry is not None:
+                entries[entry[0]] = entry
+        return self.camera.detect_emotions(list(entries.values()))
 
     def match_facial_emotions_to_sentences(self, facial_emotions, sentences, start_time):
         matched_data = []
-        sentence_start_time = 0
         for i, sentence_data in enumerate(sentences):
-            sentence, audio_segment, duration, sentiment, audio_emotion = sentence_data
+            sentence, audio_segment, duration, sentiment, audio_emotion, sentence_start_time = sentence_data
             sentence_end_time = sentence_start_time + duration / 1000.0
             
             emotions_list = []
@@ -255,8 +257,6 @@ class ConversationModule(QThread):
                     emotions_list.append((emotions, relative_timestamp))
             matched_data.append((sentence, emotions_list, sentiment, audio_emotion, sentence_start_time, sentence_end_time))
 
-            sentence_start_time = sentence_end_time
-
         return matched_data
 
     def merge_emotion_data(self, sentences, matched_data):
@@ -294,10 +294,10 @@ class ConversationModule(QThread):
             audio_emotion = sentence['audio_emotion']
             detected_emotions = sentence['detected_emotions']
 
-            if audio_emotion['emotion'] in ['neutral', 'unknown', 'other']:
+            if audio_emotion.get('emotion', 'unknown') in ['neutral', 'unknown', 'other']:
                 audio_emotion_confidence = 0
             else:
-                audio_emotion_confidence = audio_emotion['confidence']
+                audio_emotion_confidence = audio_emotion.get('confidence', 0)
 
             if not detected_emotions:
                 detected_emotions = [(0, 0)]
@@ -327,26 +327,37 @@ class ConversationModule(QThread):
         return memories
 
     def add_to_user_memories(self, user, question, memories):
+        question_object = self.remember(user, question, memories)
+        self.save_memory(user, question_object)
+        return user
+
+    def remember(self, user, question, memories):
         question_object = self.create_memory_object(question, memories)
-        
-        self.users_collection.update_one(
-            {'user_name': user['user_name']},
-            {'$push': {'memories': question_object}}
-        )
 
         if 'memories' not in user:
             user['memories'] = []
         user['memories'].append(question_object)
+        self.memory_index.add(question_object)
 
         self.conversation_updated.emit(self.conversation_history.get_history())
 
-        return user
+        return question_object
+
+    def save_memory(self, user, question_object):
+        # Append-only: the user document itself is never rewritten.
+        self.persistence.insert(self.memories_collection, {
+            'user_id': user['_id'],
+            'question': question_object['question'],
+            'answers': question_object['answers'],
+            'created_at': question_object['created_at']
+        })
 
     def create_memory_object(self, question, memories):
         answers = [sentence['text'] for sentence in memories]
         return {
             'question': question,
-            'answers': answers
+            'answers': answers,
+            'created_at': datetime.datetime.now(datetime.timezone.utc)
         }
 
     def memory_score(self, subjectivity, audio_confidence, detected_emotions):
@@ -0,0 +1,133 @@
+import time
+import cv2
+import numpy as np
+from emotion_model_module import FER_LABELS, INPUT_SIZE
+from registry_module import EMOTION_MODEL, registry
+
+try:
+    from google.cloud import vision
+    from google.api_core.exceptions import ServiceUnavailable
+except ImportError:
+    vision = None
+
+EMOTIONS = ('anger', 'joy', 'sorrow', 'surprise')
+
+# Which of the model's FER2013 classes each reported emotion reads from.
+FER_CLASSES = {'anger': 'angry', 'joy': 'happy', 'sorrow': 'sad', 'surprise': 'surprise'}
+# Probability cut-offs for Google Vision's likelihood scale: 1 (very unlikely) up to 5 (very likely).
+LIKELIHOOD_THRESHOLDS = np.array([0.1, 0.3, 0.5, 0.75])
+
+def likelihood(probability):
+    return 1 + int(np.searchsorted(LIKELIHOOD_THRESHOLDS, probability, side='right'))
+
+class LocalEmotionBackend:
+    # A FER2013-trained CNN run on CPU over the faces the camera has already found; no network calls.
+    def __init__(self, camera, model_path=EMOTION_MODEL):
+        self.camera = camera
+        self.model_path = model_path
+        self.min_interval = 0.0
+        # The crop the model was trained on, relative to the distance between the eyes.
+        self.face_size = 2.2
+        self.eye_offset = 0.45
+
+    @property
+    def model(self):
+        return registry.get('emotion_model', self.model_path)
+
+    def face_input(self, analysis):
+        # Rotates the face upright on the eye line and crops it to the model's 64x64 grayscale input in one warp.
+        points = self.camera.face_landmarks(analysis)
+        if points is None:
+            return None
+        left_eye = points[36:42].mean(axis=0)
+        right_eye = points[42:48].mean(axis=0)
+        dx, dy = right_eye - left_eye
+        iod = max(float(np.hypot(dx, dy)), 1.0)
+        centre = (left_eye + right_eye) / 2 + np.array([-dy, dx]) * self.eye_offset
+        transform = cv2.getRotationMatrix2D((float(centre[0]), float(centre[1])), float(np.degrees(np.arctan2(dy, dx))), INPUT_SIZE / (self.face_size * iod))
+        transform[:, 2] += INPUT_SIZE / 2 - centre
+        return cv2.warpAffine(analysis.gray, transform, (INPUT_SIZE, INPUT_SIZE), flags=cv2.INTER_AREA, borderMode=cv2.BORDER_REPLICATE)
+
+    def detect_batch(self, analyses):
+        faces = [self.face_input(analysis) for analysis in analyses]
+        found = [i for i, face in enumerate(faces) if face is not None]
+        results = [None] * len(analyses)
+        if not found:
+            return results
+
+        try:
+            probabilities = self.model.predict(np.stack([faces[i] for i in found]))
+        except Exception as e:
+            print(f"Error running the local emotion model: {str(e)}")
+            return results
+
+        columns = {emotion: FER_LABELS.index(label) for emotion, label in FER_CLASSES.items()}
+        for i, row in zip(found, probabilities):
+            results[i] = {emotion: likelihood(row[column]) for emotion, column in columns.items()}
+        return results
+
+class GoogleVisionEmotionBackend:
+    def __init__(self, credentials_path='./resources/gcp_vision_credentials.json', retries=3):
+        if vision is None:
+            raise ImportError("google-cloud-vision is required for the Google Vision emotion backend")
+        self.credentials_path = credentials_path
+        self.min_interval = 0.5
+        self.retries = retries
+        self.max_batch_size = 16
+
+    @property
+    def client(self):
+        return registry.get('vision_client', self.credentials_path)
+
+    def detect_batch(self, analyses):
+        # Only faces found locally are uploaded, and only the padded face crop rather than the whole frame.
+        crops = [analysis.crop() for analysis in analyses]
+        found = [i for i, crop in enumerate(crops) if crop is not None and crop.size]
+        results = [None] * len(analyses)
+        for start in range(0, len(found), self.max_batch_size):
+            batch = found[start:start + self.max_batch_size]
+            for i, emotions in zip(batch, self._annotate([crops[i] for i in batch])):
+                results[i] = emotions
+        return results
+
+    def _annotate(self, crops):
+        requests = []
+        for crop in crops:
+            success, encoded_image = cv2.imencode('.jpg', crop)
+            image = vision.Image(content=encoded_image.tobytes() if success else b'')
+            requests.append(vision.AnnotateImageRequest(
+                image=image,
+                features=[vision.Feature(type_=vision.Feature.Type.FACE_DETECTION, max_results=1)],
+            ))
+
+        for attempt in range(self.retries):
+            try:
+                response = self.client.batch_annotate_images(requests=requests)
+                break
+            except ServiceUnavailable:
+                print(f"service unavailable, retrying ({attempt+1}/{self.retries})!")
+                time.sleep(0.2 * 2 ** attempt)
+            except Exception as e:
+                print(f"an error occurred: {str(e)}!")
+                return [None] * len(crops)
+        else:
+            return [None] * len(crops)
+
+        results = []
+        for annotation in response.responses:
+            if not annotation.face_annotations:
+                results.append(None)
+                continue
+            face = annotation.face_annotations[0]
+            results.append({
+                'anger': int(face.anger_likelihood),
+                'joy': int(face.joy_likelihood),
+                'sorrow': int(face.sorrow_likelihood),
+                'surprise': int(face.surprise_likelihood),
+            })
+        return results
+#
+#
+#
+#
+#
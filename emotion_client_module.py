@@ -0,0 +1,51 @@
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from tracing_module import tracer
+
+class AudioEmotionClient:
+    def __init__(self, api_url='http://127.0.0.1:8000/emotion_recognition', max_workers=4, timeout=(2, 15)):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        # The service is local, so skip proxy lookups instead of patching os.environ['no_proxy'].
+        self.session.trust_env = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='audio-emotion')
+
+    @tracer.traced('emotion_client.detect')
+    def detect(self, wav_bytes, headers=None):
+        try:
+            files = {'audio_file': ('audio.wav', wav_bytes, 'audio/wav')}
+            response = self.session.post(self.api_url, files=files, headers=headers, timeout=self.timeout)
+
+            if response.status_code == 200:
+                result = response.json()
+                return {
+                    'emotion': result['emotion'],
+                    'confidence': result['confidence']
+                }
+            else:
+                return self.unknown(f'API request failed with status code {response.status_code}: {response.text}')
+        except Exception as e:
+            return self.unknown(str(e))
+
+    def unknown(self, error):
+        # Callers always get an emotion; 'error' says why it could not be detected.
+        print(f"Audio emotion detection failed: {error}")
+        return {'emotion': 'unknown', 'confidence': 0.0, 'error': error}
+
+    def detect_many(self, wav_list):
+        # Results come back in the same order as the segments.
+        return list(self.executor.map(self.detect, wav_list))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+#
+#
+#
+#
+#
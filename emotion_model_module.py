@@ -0,0 +1,91 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Output order of the FER2013 mini-Xception classifier.
+FER_LABELS = ('angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral')
+INPUT_SIZE = 64
+BN_EPSILON = 1e-3
+
+def same_padding(size, kernel, stride):
+    # TensorFlow's 'same': output is ceil(size / stride), any odd padding goes after.
+    output = -(-size // stride)
+    total = max((output - 1) * stride + kernel - size, 0)
+    return total // 2, total - total // 2
+
+def pad(x, kernel, stride, value=0.0):
+    top, bottom = same_padding(x.shape[1], kernel, stride)
+    left, right = same_padding(x.shape[2], kernel, stride)
+    return np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)), constant_values=value)
+
+def windows(x, kernel, stride):
+    # (N, H, W, C) -> (N, H', W', C, kernel, kernel) views, no copy.
+    return sliding_window_view(x, (kernel, kernel), axis=(1, 2))[:, ::stride, ::stride]
+
+def conv(x, kernel, stride=1, padding='same'):
+    size = kernel.shape[0]
+    if size == 1:
+        if padding == 'same' and stride > 1:
+            x = pad(x, 1, stride)
+        return x[:, ::stride, ::stride] @ kernel[0, 0]
+    if padding == 'same':
+        x = pad(x, size, stride)
+    return np.einsum('nhwcij,ijcf->nhwf', windows(x, size, stride), kernel, optimize=True)
+
+def depthwise(x, kernel):
+    return np.einsum('nhwcij,ijc->nhwc', windows(pad(x, kernel.shape[0], 1), kernel.shape[0], 1), kernel[:, :, :, 0], optimize=True)
+
+def max_pool(x, size=3, stride=2):
+    return windows(pad(x, size, stride, -np.inf), size, stride).max(axis=(4, 5))
+
+class EmotionNet:
+    # Inference-only mini-Xception (Arriaga et al., trained on FER2013), run with NumPy on CPU.
+    def __init__(self, weights):
+        self.weights = weights
+
+    def batch_norm(self, x, name):
+        w = self.weights
+        scale = w[f'{name}/gamma'] / np.sqrt(w[f'{name}/moving_variance'] + BN_EPSILON)
+        return x * scale + (w[f'{name}/beta'] - w[f'{name}/moving_mean'] * scale)
+
+    def separable(self, x, name):
+        return conv(depthwise(x, self.weights[f'{name}/depthwise_kernel']), self.weights[f'{name}/pointwise_kernel'])
+
+    def predict(self, faces):
+        # faces: (N, 64, 64) grayscale uint8 crops. Returns (N, 7) class probabilities in FER_LABELS order.
+        w = self.weights
+        x = (np.asarray(faces, dtype=np.float32)[..., None] / 255.0 - 0.5) * 2.0
+
+        x = np.maximum(self.batch_norm(conv(x, w['conv2d_1/kernel'], padding='valid'), 'batch_normalization_1'), 0)
+        x = np.maximum(self.batch_norm(conv(x, w['conv2d_2/kernel'], padding='valid'), 'batch_normalization_2'), 0)
+
+        # Four residual blocks: two separable convolutions and a pool, plus a strided 1x1 shortcut.
+        for block in range(4):
+            residual = self.batch_norm(conv(x, w[f'conv2d_{block + 3}/kernel'], stride=2), f'batch_normalization_{3 * block + 3}')
+            x = np.maximum(self.batch_norm(self.separable(x, f'separable_conv2d_{2 * block + 1}'), f'batch_normalization_{3 * block + 4}'), 0)
+            x = self.batch_norm(self.separable(x, f'separable_conv2d_{2 * block + 2}'), f'batch_normalization_{3 * block + 5}')
+            x = max_pool(x) + residual
+
+        logits = (conv(x, w['conv2d_7/kernel']) + w['conv2d_7/bias']).mean(axis=(1, 2))
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+def load_emotion_model(path):
+    # The Keras weights file from the fer package (fer/data/emotion_model.hdf5).
+    import h5py
+    weights = {}
+    with h5py.File(path, 'r') as model:
+        group = model['model_weights'] if 'model_weights' in model else model
+
+        def collect(name, dataset):
+            if isinstance(dataset, h5py.Dataset):
+                # 'conv2d_1/conv2d_1_1/kernel:0' -> 'conv2d_1/kernel'
+                parts = name.split('/')
+                weights[f"{parts[0]}/{parts[-1].split(':')[0]}"] = np.array(dataset, dtype=np.float32)
+        group.visititems(collect)
+    return EmotionNet(weights)
+#
+#
+#
+#
+#
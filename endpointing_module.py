@@ -0,0 +1,143 @@
+import re
+from collections import Counter, deque
+from threading import Lock
+
+TERMINAL_PUNCTUATION = re.compile(r'[.!?]["\')\]]*$')
+# A sentence that ends on one of these is usually about to carry on.
+INCOMPLETE_ENDINGS = {
+    'a', 'and', 'because', 'but', 'like', 'my', 'of', 'or', 'so', 'the', 'then', 'to', 'uh', 'um', 'with',
+}
+
+def looks_complete(result):
+    if result is None or not result.is_final:
+        return False
+    text = result.transcript.strip()
+    if not TERMINAL_PUNCTUATION.search(text):
+        return False
+    words = re.findall(r"[a-z']+", text.lower())
+    return bool(words) and words[-1] not in INCOMPLETE_ENDINGS
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class Endpointer:
+    def __init__(self, frame_duration=0.03, smoothing=0.35, onset_threshold=0.6, release_threshold=0.3,
+                 min_silence=0.5, max_silence=2.0, initial_silence=1.0, pause_margin=1.25, min_pause=0.15,
+                 early_commit=True, early_commit_silence=0.35, no_speech_timeout=8.0, max_duration=30.0, history=200):
+        self.frame_duration = frame_duration
+        self.smoothing = smoothing
+        self.onset_threshold = onset_threshold
+        self.release_threshold = release_threshold
+        self.min_silence = min_silence
+        self.max_silence = max_silence
+        self.initial_silence = initial_silence
+        self.pause_margin = pause_margin
+        self.min_pause = min_pause
+        self.early_commit = early_commit
+        self.early_commit_silence = early_commit_silence
+        self.no_speech_timeout = no_speech_timeout
+        self.max_duration = max_duration
+        self.pauses = deque(maxlen=history)
+        self.metrics = deque(maxlen=history)
+        self._partial = None
+        self._lock = Lock()
+        self.reset()
+
+    def silence_threshold(self):
+        # Long enough to sit through the pauses this speaker usually takes mid-answer, within fixed bounds.
+        if len(self.pauses) < 5:
+            return self.initial_silence
+        threshold = percentile(self.pauses, 0.9) * self.pause_margin
+        return min(self.max_silence, max(self.min_silence, threshold))
+
+    def reset(self):
+        self.elapsed = 0.0
+        self.probability = 0.0
+        self.in_speech = False
+        self.speech_started = False
+        self.last_speech = 0.0
+        self.pause_start = None
+        self.threshold = self.silence_threshold()
+        self.turn_pauses = 0
+        self.result = None
+        with self._lock:
+            self._partial = None
+
+    def partial(self, result):
+        with self._lock:
+            self._partial = result
+
+    @property
+    def trailing_silence(self):
+        return self.elapsed - self.last_speech if self.speech_started else self.elapsed
+
+    def update(self, is_speech):
+        # Returns True once the turn should end; the reason and latency are in self.result.
+        self.elapsed += self.frame_duration
+        self.probability += self.smoothing * ((1.0 if is_speech else 0.0) - self.probability)
+
+        if not self.in_speech and self.probability >= self.onset_threshold:
+            if self.pause_start is not None:
+                pause = self.elapsed - self.pause_start
+                if pause >= self.min_pause:
+                    self.pauses.append(pause)
+                    self.turn_pauses += 1
+            self.in_speech = True
+            self.speech_started = True
+            self.pause_start = None
+        elif self.in_speech and self.probability < self.release_threshold:
+            # The smoothed probability gives a short hangover, so single dropped frames never count as a pause.
+            self.in_speech = False
+            self.pause_start = self.last_speech
+        # Isolated speech frames that never reach the onset threshold do not reset the silence.
+        if is_speech and self.in_speech:
+            self.last_speech = self.elapsed
+
+        if self.elapsed >= self.max_duration:
+            return self.commit('max_duration')
+        if not self.speech_started:
+            if self.elapsed >= self.no_speech_timeout:
+                return self.commit('no_speech')
+            return False
+        if self.in_speech:
+            return False
+
+        silence = self.elapsed - self.last_speech
+        if silence >= self.threshold:
+            return self.commit('silence')
+        if self.early_commit and silence >= self.early_commit_silence:
+            with self._lock:
+                partial = self._partial
+            if looks_complete(partial):
+                return self.commit('early_commit')
+        return False
+
+    def commit(self, reason):
+        self.result = {
+            'reason': reason,
+            # Time from the last speech frame to the decision: the dead air the user sits through.
+            'endpoint_latency': self.trailing_silence if self.speech_started else 0.0,
+            'threshold': self.threshold,
+            'duration': self.elapsed,
+            'pauses': self.turn_pauses,
+        }
+        self.metrics.append(self.result)
+        return True
+
+    def summary(self):
+        summary = {
+            'turns': len(self.metrics),
+            'reasons': dict(Counter(metrics['reason'] for metrics in self.metrics)),
+            'silence_threshold_ms': self.silence_threshold() * 1000,
+        }
+        latencies = [metrics['endpoint_latency'] for metrics in self.metrics if metrics['reason'] in ('silence', 'early_commit')]
+        if latencies:
+            summary['p50_latency_ms'] = percentile(latencies, 0.5) * 1000
+            summary['p90_latency_ms'] = percentile(latencies, 0.9) * 1000
+        return summary
+#
+#
+#
+#
+#
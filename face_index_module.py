@@ -0,0 +1,85 @@
+import numpy as np
+from threading import Lock
+
+class FaceIndex:
+    def __init__(self, users_collection, threshold=0.6, dimensions=128):
+        self.users_collection = users_collection
+        self.threshold = threshold
+        self.dimensions = dimensions
+        self._lock = Lock()
+        self._ids = []
+        self._matrix = np.empty((64, dimensions), dtype=np.float32)
+        self._sq_norms = np.empty(64, dtype=np.float32)
+        self._size = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._size
+
+    def load(self):
+        ids = []
+        encodings = []
+        for stored_face in self.users_collection.find({'face_encoding': {'$exists': True}}, {'face_encoding': 1, 'face_exemplars': 1}):
+            # Each user contributes their centroid plus any stored exemplars; a query matches the closest of them.
+            for encoding in [stored_face.get('face_encoding')] + list(stored_face.get('face_exemplars') or []):
+                if encoding is None or len(encoding) != self.dimensions:
+                    continue
+                ids.append(stored_face['_id'])
+                encodings.append(encoding)
+
+        matrix = np.array(encodings, dtype=np.float32).reshape(-1, self.dimensions)
+        capacity = max(64, len(ids))
+        with self._lock:
+            self._matrix = np.empty((capacity, self.dimensions), dtype=np.float32)
+            self._matrix[:len(ids)] = matrix
+            self._sq_norms = np.empty(capacity, dtype=np.float32)
+            self._sq_norms[:len(ids)] = np.einsum('ij,ij->i', matrix, matrix)
+            self._ids = ids
+            self._size = len(ids)
+
+        print(f"Loaded {len(ids)} face encodings for {len(set(ids))} users into the face index")
+
+    def add(self, user_id, face_encoding, exemplars=()):
+        for encoding in [face_encoding] + list(exemplars):
+            self._append(user_id, encoding)
+
+    def _append(self, user_id, face_encoding):
+        encoding = np.asarray(face_encoding, dtype=np.float32).reshape(self.dimensions)
+        with self._lock:
+            if self._size == len(self._matrix):
+                # Grow geometrically so enrolling stays amortised O(1).
+                capacity = len(self._matrix) * 2
+                matrix = np.empty((capacity, self.dimensions), dtype=np.float32)
+                matrix[:self._size] = self._matrix[:self._size]
+                sq_norms = np.empty(capacity, dtype=np.float32)
+                sq_norms[:self._size] = self._sq_norms[:self._size]
+                self._matrix = matrix
+                self._sq_norms = sq_norms
+
+            self._matrix[self._size] = encoding
+            self._sq_norms[self._size] = encoding @ encoding
+            self._ids.append(user_id)
+            self._size += 1
+
+    def query(self, face_encoding):
+        query = np.asarray(face_encoding, dtype=np.float32).reshape(self.dimensions)
+        with self._lock:
+            if self._size == 0:
+                return None, None
+
+            # ||a - q||^2 = ||a||^2 - 2 a.q + ||q||^2, one matrix-vector product for the whole gallery.
+            sq_dists = self._sq_norms[:self._size] - 2.0 * (self._matrix[:self._size] @ query) + query @ query
+            best = int(np.argmin(sq_dists))
+            distance = float(np.sqrt(max(sq_dists[best], 0.0)))
+            return self._ids[best], distance
+
+    def match(self, face_encoding):
+        user_id, distance = self.query(face_encoding)
+        if user_id is None or distance >= self.threshold:
+            return None, distance
+        return user_id, distance
+#
+#
+#
+#
+#
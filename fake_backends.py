@@ -0,0 +1,337 @@
+import json
+import time
+import wave
+from io import BytesIO
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+class FakeEmotionServer:
+    def __init__(self, emotion='neutral', confidence=0.5, latency=0.0, status_code=200, responses=None, keyed_responses=None):
+        self.emotion = emotion
+        self.confidence = confidence
+        self.latency = latency
+        self.status_code = status_code
+        # Canned responses are handed out in arrival order, cycling when they run out.
+        self.responses = list(responses or [])
+        # Replayed responses looked up by the request's X-Replay-Key header, so concurrent requests get the same answer every run.
+        self.keyed_responses = dict(keyed_responses or {})
+        self.requests = 0
+        self._lock = Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/emotion_recognition"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with fake._lock:
+                    index = fake.requests
+                    fake.requests += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                key = self.headers.get('X-Replay-Key')
+                if key in fake.keyed_responses:
+                    response = fake.keyed_responses[key]
+                elif fake.responses:
+                    response = fake.responses[index % len(fake.responses)]
+                else:
+                    response = {'emotion': fake.emotion, 'confidence': fake.confidence}
+                body = json.dumps(response).encode()
+                self.send_response(fake.status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class FakeMistralServer(FakeEmotionServer):
+    def __init__(self, reply="Hello there! How was your day?", token_latency=0.0, latency=0.0, status_code=200, replies=None, events=None):
+        super().__init__(latency=latency, status_code=status_code)
+        self.reply = reply
+        self.replies = list(replies or [])
+        # Raw "data:" payloads to stream verbatim instead of the reply, for feeding the client broken streams.
+        self.events = events
+        self.token_latency = token_latency
+        self.prompts = []
+
+    def next_reply(self, index):
+        if self.replies:
+            return self.replies[index % len(self.replies)]
+        return self.reply
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with fake._lock:
+                    reply = fake.next_reply(fake.requests)
+                    fake.requests += 1
+                    fake.prompts.append(data.get('messages', []))
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if fake.status_code != 200 or not data.get('stream'):
+                    body = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': reply}}]}).encode()
+                    self.send_response(fake.status_code)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                if fake.events is not None:
+                    payloads = fake.events
+                else:
+                    tokens = reply.split(' ')
+                    payloads = []
+                    for i, token in enumerate(tokens):
+                        content = token if i == len(tokens) - 1 else token + ' '
+                        payloads.append(json.dumps({'choices': [{'index': 0, 'delta': {'content': content}}]}))
+                    payloads.append("[DONE]")
+                for payload in payloads:
+                    self.write_chunk(f"data: {payload}\n\n".encode())
+                    if fake.token_latency:
+                        time.sleep(fake.token_latency)
+                self.write_chunk(b"")
+
+            def write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+# Collection and database calls that go over the network against a real server.
+ROUND_TRIPS = {
+    'bulk_write', 'count_documents', 'create_index', 'delete_many', 'delete_one', 'find', 'find_one',
+    'insert_many', 'insert_one', 'update_many', 'update_one',
+}
+
+class DelayedMongo:
+    # Wraps a mongomock client, database or collection and delays every round trip by a fixed latency.
+    def __init__(self, target, latency=0.0):
+        self._target = target
+        self._latency = latency
+
+    def __getattr__(self, name):
+        import mongomock
+        attribute = getattr(self._target, name)
+        if isinstance(attribute, (mongomock.Database, mongomock.Collection)):
+            return DelayedMongo(attribute, self._latency)
+        if name in ROUND_TRIPS and self._latency:
+            def delayed(*args, **kwargs):
+                time.sleep(self._latency)
+                return attribute(*args, **kwargs)
+            return delayed
+        return attribute
+
+class FakeMongoClient(DelayedMongo):
+    def __init__(self, latency=0.0):
+        import mongomock
+        super().__init__(mongomock.MongoClient(), latency)
+
+def silent_wav(seconds, rate=24000):
+    out = BytesIO()
+    with wave.open(out, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(b'\x00\x00' * int(seconds * rate))
+    return out.getvalue()
+
+class FakeTTSClient:
+    def __init__(self, latency=0.0, seconds_per_character=0.06):
+        self.latency = latency
+        self.seconds_per_character = seconds_per_character
+        self.requests = 0
+
+    def synthesize_speech(self, input, voice=None, audio_config=None):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        # Silence roughly as long as the sentence would take to say, so playback time stays realistic.
+        return SimpleNamespace(audio_content=silent_wav(max(0.2, len(input.text) * self.seconds_per_character)))
+
+class PacedStream:
+    def __init__(self, rate, sample_width, channels, speed=1.0):
+        self.bytes_per_second = rate * sample_width * channels
+        self.speed = speed
+        self.started = None
+        self.elapsed = 0.0
+
+    def pace(self, num_bytes):
+        # Block like a real device would, scaled by the replay speed.
+        if self.started is None:
+            self.started = time.perf_counter()
+        self.elapsed += num_bytes / self.bytes_per_second
+        delay = self.started + self.elapsed / self.speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+class ReplayInputStream(PacedStream):
+    def __init__(self, audio, rate, channels, speed=1.0):
+        super().__init__(rate, 2, channels, speed)
+        self.audio = audio
+        self.position = 0
+
+    def read(self, num_frames, exception_on_overflow=True):
+        # The recorded turn, then silence so voice activity detection ends the recording as it did live.
+        num_bytes = num_frames * 2
+        data = self.audio[self.position:self.position + num_bytes]
+        self.position += num_bytes
+        self.pace(num_bytes)
+        return data + b'\x00' * (num_bytes - len(data))
+
+class ReplayCallbackStream:
+    def __init__(self, source, frames_per_buffer, callback):
+        # Drives a callback-mode stream from its own thread, as PortAudio would.
+        self.source = source
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = callback
+        self.thread = None
+        self.running = False
+
+    def start_stream(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while self.running:
+            data = self.source.read(self.frames_per_buffer)
+            self.callback(data, self.frames_per_buffer, {}, 0)
+
+    def is_active(self):
+        return self.running
+
+    def stop_stream(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop_stream()
+
+class FakeOutputStream(PacedStream):
+    def __init__(self, rate, sample_width, channels, speed=1.0):
+        super().__init__(rate, sample_width, channels, speed)
+        self.bytes_written = 0
+
+    def write(self, frames):
+        self.bytes_written += len(frames)
+        self.pace(len(frames))
+
+class FakePyAudio:
+    def __init__(self, recordings=(), speed=1.0):
+        self.recordings = list(recordings)
+        self.speed = speed
+        self.opened = 0
+
+    def get_format_from_width(self, width):
+        return width
+
+    def open(self, format=None, channels=1, rate=16000, input=False, output=False, frames_per_buffer=1024, stream_callback=None, start=True):
+        if input:
+            # Each input stream plays back the next recorded turn.
+            audio = self.recordings[self.opened] if self.opened < len(self.recordings) else b''
+            self.opened += 1
+            stream = ReplayInputStream(audio, rate, channels, self.speed)
+            if stream_callback is not None:
+                return ReplayCallbackStream(stream, frames_per_buffer, stream_callback)
+            return stream
+        return FakeOutputStream(rate, format or 2, channels, self.speed)
+
+    def terminate(self):
+        pass
+
+class ReplayCapture:
+    def __init__(self, frames, speed=1.0):
+        # frames are (offset in seconds, JPEG bytes) as recorded; decoded once and looped.
+        import cv2
+        import numpy as np
+        self.offsets = [offset for offset, _ in frames]
+        self.frames = [cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) for _, data in frames]
+        self.duration = (self.offsets[-1] - self.offsets[0] + 0.1) if self.offsets else 0.0
+        self.speed = speed
+        self.index = 0
+        self.started = None
+        self.opened = bool(self.frames)
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        if self.started is None:
+            self.started = time.perf_counter()
+
+        loop, position = divmod(self.index, len(self.frames))
+        offset = loop * self.duration + self.offsets[position] - self.offsets[0]
+        delay = self.started + offset / self.speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.index += 1
+        return True, self.frames[position].copy()
+
+    def release(self):
+        self.opened = False
+#
+#
+#
+#
+#
@@ -0,0 +1,51 @@
+from collections import deque
+from threading import Condition
+
+class FrameBuffer:
+    def __init__(self, size=90):
+        self._frames = deque(maxlen=size)
+        self._condition = Condition()
+        self._sequence = 0
+
+    def publish(self, frame, timestamp):
+        with self._condition:
+            self._sequence += 1
+            self._frames.append((self._sequence, timestamp, frame))
+            self._condition.notify_all()
+            return self._sequence
+
+    def latest(self):
+        with self._condition:
+            if not self._frames:
+                return None
+            return self._frames[-1]
+
+    def wait_for_next(self, after_sequence, timeout=1.0):
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence > after_sequence, timeout=timeout)
+            if not self._frames or self._frames[-1][0] <= after_sequence:
+                return None
+            return self._frames[-1]
+
+    def closest(self, timestamp, tolerance=None):
+        # The frame taken nearest to the timestamp, e.g. a moment in the recorded audio; None if none is within tolerance.
+        with self._condition:
+            if not self._frames:
+                return None
+            entry = min(self._frames, key=lambda entry: abs(entry[1] - timestamp))
+        if tolerance is not None and abs(entry[1] - timestamp) > tolerance:
+            return None
+        return entry
+
+    def between(self, start_time, end_time):
+        with self._condition:
+            return [entry for entry in self._frames if start_time <= entry[1] <= end_time]
+
+    def clear(self):
+        with self._condition:
+            self._frames.clear()
+#
+#
+#
+#
+#
@@ -1,5 +1,13 @@
+import re
+import json
 import requests
+from requests.adapters import HTTPAdapter
 from threading import Lock
+from memory_retrieval_module import MemoryIndex
+from prompt_builder_module import PromptBuilder
+from tracing_module import tracer
+
+SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s')
 
 class ThreadSafeConversationHistory:
     def __init__(self):
@@ -15,66 +23,107 @@ class ThreadSafeConversationHistory:
             return list(self._history)
 
 class Ioanna:
-    def __init__(self, api_key, follow_up_limit=2, conversation_history=None):
+    def __init__(self, api_key, follow_up_limit=2, conversation_history=None, memory_index=None):
         self.api_key = api_key
         self.api_url = "https://api.mistral.ai/v1/chat/completions"
         self.conversation_history = conversation_history if conversation_history is not None else ThreadSafeConversationHistory()
         self.follow_up_counter = 0
         self.follow_up_limit = follow_up_limit
+        self.memory_index = memory_index if memory_index is not None else MemoryIndex()
+        self.memory_count = 5
+        self.memory_token_budget = 300
+        self.prompt_builder = PromptBuilder()
         self._lock = Lock()
+        self.timeout = (5, 30)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+    def build_prompt(self, user):
+        history = self.conversation_history.get_history()
+        query = " ".join(msg['content'] for msg in history[-2:])
+        memories = self.memory_index.search(query, k=self.memory_count, token_budget=self.memory_token_budget)
+        return self.prompt_builder.build(user['user_name'], history, memories)
+
+    def request_data(self, prompt, stream=False):
+        return {
+            "model": "mistral-tiny",
+            "messages": [{"role": "system", "content": prompt}],
+            "max_tokens": 50,
+            "temperature": 0.7,
+            "stream": stream
+        }
+
+    def headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def record_question(self, question):
+        self.conversation_history.append({'role': 'assistant', 'content': question})
+        self.follow_up_counter += 1
+
+        if self.follow_up_counter >= self.follow_up_limit:
+            self.follow_up_counter = 0
+
+        print(f"question: {question}")
 
-    def get_question(self, user):
+    def stream_question(self, user, fallback=None):
+        # Yields the question sentence by sentence as tokens arrive; if nothing usable arrives, yields the fallback instead.
         with self._lock:
-            history = self.conversation_history.get_history()
-            
-            if not history:
-                prompt = f'''
-                You are speaking to {user['user_name']}. Ignore face encoding completely.
-                Address them by name and try to get to know them by asking about random life experiences.
-                Do not ask about include anthing from {user['memories']} in the conversation, unless you want to answer a question.
-                Keep your messages brief and concise, 25 words maximum.
-                This conversation is happening via text to speech, so use emotional cues to show genuine interest.
-                Ask a question to start the conversation.
-                Do not use information the memories array to ask question unless you are answering a question.
-                '''
-            else:
-                history_string = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history[-5:]])
-                prompt = f'''
-                You are continuing a conversation with {user}. Here's the recent context:
-
-                {history_string} along with the memories array in {user}
-
-                Based on this context, generate a follow-up question or comment that maintains the flow of the conversation.
-                Keep your response brief and concise, 25 words maximum.
-                Show genuine interest in their responses and ask for more details when appropriate.
-                '''
-
-            try:
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                data = {
-                    "model": "mistral-tiny",
-                    "messages": [{"role": "system", "content": prompt}],
-                    "max_tokens": 50,
-                    "temperature": 0.7
-                }
-                response = requests.post(self.api_url, json=data, headers=headers)
+            prompt = self.build_prompt(user)
+
+        question = ""
+        try:
+            with tracer.span('ioanna.stream_question') as span:
+                for sentence in self.stream_sentences(prompt):
+                    if not question:
+                        span.mark('first_sentence_ms')
+                    question += sentence + " "
+                    yield sentence
+
+            if not question.strip() and fallback:
+                print(f"No question came back, asking instead: {fallback}")
+                question = fallback
+                yield fallback
+        finally:
+            if question.strip():
+                with self._lock:
+                    self.record_question(question.strip())
+
+    def stream_sentences(self, prompt):
+        buffer = ""
+        try:
+            with self.session.post(self.api_url, json=self.request_data(prompt, stream=True), headers=self.headers(), timeout=self.timeout, stream=True) as response:
                 response.raise_for_status()
-                question = response.json()['choices'][0]['message']['content'].strip()
-                
-                self.conversation_history.append({'role': 'assistant', 'content': question})
-                self.follow_up_counter += 1
-                
-                if self.follow_up_counter >= self.follow_up_limit:
-                    self.follow_up_counter = 0
-                
-                print(f"question: {question}")
-                return question
-            except requests.RequestException as e:
-                print(f"An error occurred: {str(e)}")
-                return None
+                # Event streams are UTF-8, but without a charset requests would decode them as ISO-8859-1.
+                response.encoding = 'utf-8'
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+
+                    try:
+                        delta = json.loads(payload)['choices'][0].get('delta', {})
+                    except (json.JSONDecodeError, KeyError, IndexError) as e:
+                        print(f"Skipping malformed stream event {payload!r}: {e!r}")
+                        continue
+                    buffer += delta.get('content') or ""
+
+                    match = SENTENCE_END.search(buffer)
+                    while match:
+                        sentence = buffer[:match.end()].strip()
+                        buffer = buffer[match.end():]
+                        if sentence:
+                            yield sentence
+                        match = SENTENCE_END.search(buffer)
+
+            if buffer.strip():
+                yield buffer.strip()
+        except requests.RequestException as e:
+            print(f"An error occurred: {str(e)}")
 #
 #
 #
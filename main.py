@@ -1,3 +1,4 @@
+import os
 import sys
 from PyQt5.QtWidgets import QApplication
 from user_interface import App
@@ -5,5 +6,9 @@ from user_interface import App
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     main_window = App()
+    if os.environ.get('IOANNA_RECORD'):
+        # Capture frames, audio and backend responses for offline replay with benchmark_module.py.
+        from replay_module import SessionRecorder
+        SessionRecorder(main_window.conversation_module, os.environ['IOANNA_RECORD']).attach()
     main_window.run()
     sys.exit(app.exec_())
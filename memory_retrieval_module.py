@@ -0,0 +1,97 @@
+import math
+import re
+from collections import Counter
+from threading import Lock
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'do', 'did', 'for', 'from', 'have', 'i', 'in', 'is',
+    'it', 'its', 'me', 'my', 'of', 'on', 'or', 'so', 'that', 'the', 'their', 'them', 'they', 'this', 'to', 'was',
+    'we', 'what', 'with', 'you', 'your',
+}
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text.
+    return max(1, len(text) // 4)
+
+def memory_text(memory):
+    answers = " ".join(memory.get('answers') or [])
+    return f"{memory.get('question') or ''} {answers}".strip()
+
+class MemoryIndex:
+    def __init__(self, recency_weight=0.3, recency_half_life=20):
+        self.recency_weight = recency_weight
+        self.recency_half_life = recency_half_life
+        self._memories = []
+        self._term_counts = []
+        self._document_frequency = Counter()
+        self._lock = Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._memories)
+
+    def reset(self, memories=()):
+        with self._lock:
+            self._memories = []
+            self._term_counts = []
+            self._document_frequency = Counter()
+        self.extend(memories)
+
+    def extend(self, memories):
+        for memory in memories:
+            self.add(memory)
+
+    def add(self, memory):
+        terms = Counter(tokenize(memory_text(memory)))
+        with self._lock:
+            self._memories.append(memory)
+            self._term_counts.append(terms)
+            self._document_frequency.update(terms.keys())
+
+    def search(self, query, k=5, token_budget=300):
+        with self._lock:
+            count = len(self._memories)
+            if count == 0:
+                return []
+
+            idf = {term: math.log((count + 1) / (frequency + 1)) + 1 for term, frequency in self._document_frequency.items()}
+            query_vector = self._weights(Counter(tokenize(query)), idf)
+            query_norm = math.sqrt(sum(weight * weight for weight in query_vector.values()))
+
+            scored = []
+            for i, terms in enumerate(self._term_counts):
+                similarity = 0.0
+                if query_norm:
+                    vector = self._weights(terms, idf)
+                    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+                    if norm:
+                        similarity = sum(weight * vector.get(term, 0.0) for term, weight in query_vector.items()) / (query_norm * norm)
+                recency = 0.5 ** ((count - 1 - i) / self.recency_half_life)
+                score = (1 - self.recency_weight) * similarity + self.recency_weight * recency
+                scored.append((score, i))
+
+            selected = []
+            used = 0
+            for score, i in sorted(scored, reverse=True):
+                if len(selected) >= k:
+                    break
+                cost = estimate_tokens(memory_text(self._memories[i]))
+                if used + cost > token_budget:
+                    continue
+                selected.append(i)
+                used += cost
+
+            # Chronological order reads more naturally in the prompt.
+            return [self._memories[i] for i in sorted(selected)]
+
+    def _weights(self, terms, idf):
+        return {term: (1 + math.log(frequency)) * idf.get(term, 1.0) for term, frequency in terms.items()}
+#
+#
+#
+#
+#
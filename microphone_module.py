@@ -1,24 +1,19 @@
-import io
 import wave
 import pyaudio
 import webrtcvad
-import requests
-import spacy
 import os
-import shutil
-from google.cloud import speech
-from speaker_module import SpeakerModule
+import time
+from recognizer_module import GoogleSpeechRecognizer
+from emotion_client_module import AudioEmotionClient
 from textblob import TextBlob
-from pydub import AudioSegment
+import numpy as np
 from io import BytesIO
 from threading import Lock
-
-try:
-    spacy.load('en_core_web_sm')
-except OSError:
-    print('Downloading language model for the spaCy POS tagger')
-    from spacy.cli import download
-    download('en_core_web_sm')
+from registry_module import registry
+from nlp_module import NLPService
+from tracing_module import tracer
+from endpointing_module import Endpointer
+from audio_capture_module import AudioCapture
 
 class MicrophoneModule:
     def __init__(self, credentials_path='./resources/gcp_speech_and_text_credentials.json'):
@@ -27,137 +22,260 @@ class MicrophoneModule:
         self.channels = 1
         self.rate = 16000
         self.output_filename = "output.wav"
-        self.p = pyaudio.PyAudio()
-        self.speech_client = speech.SpeechClient.from_service_account_json(credentials_path)
-        self.speaker = SpeakerModule()
+        self.save_recordings = False
+        self.credentials_path = credentials_path
+        self._recognizer = None
+        self.nlp = NLPService()
+        self.emotion_client = AudioEmotionClient()
+        self.streaming = True
+        self.pre_roll_duration = 0.3
+        self.on_interim_transcript = None
+        self.stream_offset = None
+        self.speech_flags = []
+        self.recording_started = None
+        self.save_segments = False
+        self.segments_dir = "segments"
         self.vad = webrtcvad.Vad(3)
-        self.max_silence_duration = 2
+        self.endpointer = Endpointer(frame_duration=self.chunk / self.rate)
+        self.trailing_silence = 0.0
+        self.capture = AudioCapture(self)
+        self.keep_stream_open = False
         self._is_recording = False
         self._recording_lock = Lock()
-        self.nlp = spacy.load('en_core_web_sm')
+
+    @property
+    def p(self):
+        return registry.get('pyaudio')
+
+    @property
+    def speech_client(self):
+        return registry.get('speech_client', self.credentials_path)
+
+    @property
+    def recognizer(self):
+        if self._recognizer is None:
+            self._recognizer = GoogleSpeechRecognizer(self.speech_client, self.rate)
+        return self._recognizer
+
+    @recognizer.setter
+    def recognizer(self, recognizer):
+        self._recognizer = recognizer
 
     def is_recording_active(self):
         with self._recording_lock:
             return self._is_recording
 
-    def record(self, file_name):
+    @tracer.traced('microphone.record')
+    def record(self, file_name=None, session=None, start_position=None):
         with self._recording_lock:
             if self._is_recording:
                 print("Recording is already in progress")
-                return
+                return None
 
             self._is_recording = True
 
+        if file_name is None and self.save_recordings:
+            file_name = self.output_filename
+
+        capture = self.capture
+        # Taken before the stream starts, so a buffer delivered while it opens is part of the turn.
+        # After a barge-in the turn starts where the user did; those frames are already in the ring and get caught up on.
+        start = position = capture.written if start_position is None else max(start_position, capture.ring.oldest())
+        overflows = capture.overflows
         try:
-            stream = self.p.open(format=self.format, channels=self.channels, rate=self.rate, input=True, frames_per_buffer=self.chunk)
+            capture.start()
             print("* recording")
-            frames = []
-            silence_duration = 0
-            max_recording_duration = 30
-            total_duration = 0
-
-            while self.is_recording_active():
-                data = stream.read(self.chunk)
-                frames.append(data)
-                total_duration += self.chunk / self.rate
-
-                if self.vad.is_speech(data, self.rate):
-                    silence_duration = 0
-                else:
-                    silence_duration += self.chunk / self.rate
-
-                if silence_duration >= self.max_silence_duration or total_duration >= max_recording_duration:
+            self.recording_started = time.time() - (capture.written - start) / self.rate
+            self.speech_flags = []
+            self.endpointer.reset()
+            pre_roll_frames = max(1, int(self.pre_roll_duration * self.rate / self.chunk))
+            self.stream_offset = None
+
+            # A plain read of the flag; stop_recording only ever clears it.
+            while self._is_recording:
+                end = position + self.chunk
+                if not capture.wait_for(end):
+                    print("No audio from the microphone")
+                    break
+                # Frames are read-only views into the capture ring; nothing is copied for VAD.
+                frame = capture.view(position, end)
+                position = end
+                is_speech = self.vad.is_speech(memoryview(frame).cast('B'), self.rate)
+                self.speech_flags.append(is_speech)
+
+                if session is not None:
+                    # Only stream once speech starts, with a little pre-roll so the first word is not clipped.
+                    if self.stream_offset is None and is_speech:
+                        pre_roll_start = max(start, end - (pre_roll_frames + 1) * self.chunk)
+                        self.stream_offset = (pre_roll_start - start) / self.rate
+                        session.feed(capture.view(pre_roll_start, end).tobytes())
+                    elif self.stream_offset is not None:
+                        session.feed(frame.tobytes())
+
+                if self.endpointer.update(is_speech):
                     break
 
         except Exception as e:
             print(f"An error occurred during recording: {str(e)}")
         finally:
-            if 'stream' in locals():
-                stream.stop_stream()
-                stream.close()
-            
+            if not self.keep_stream_open:
+                capture.stop()
+
             with self._recording_lock:
                 self._is_recording = False
 
+            if capture.overflows > overflows:
+                print(f"Warning: {capture.overflows - overflows} input overflows while recording")
+            self.trailing_silence = self.endpointer.trailing_silence
+            if self.endpointer.result is not None:
+                result = self.endpointer.result
+                tracer.observe('microphone.endpoint_latency', result['endpoint_latency'])
+                print(f"endpoint: {result['reason']} after {result['endpoint_latency'] * 1000:.0f} ms of silence (threshold {result['threshold'] * 1000:.0f} ms)")
             print("* done recording")
             print("-----")
 
-            wf = wave.open(file_name, 'wb')
-            wf.setnchannels(self.channels)
-            wf.setsampwidth(self.p.get_sample_size(self.format))
-            wf.setframerate(self.rate)
-            wf.writeframes(b''.join(frames))
-            wf.close()
-
-        return file_name
+        # The whole turn as one view of the ring, which later stages slice without copying.
+        audio = capture.view(start, position)
 
-    def transcribe_and_analyze(self, file_name):
-        with io.open(file_name, "rb") as audio_file:
-            content = audio_file.read()
+        if file_name is not None:
+            with open(file_name, 'wb') as out:
+                out.write(self.to_wav_bytes(audio))
 
-        audio = speech.RecognitionAudio(content=content)
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=self.rate,
-            language_code="en-US",
-            enable_automatic_punctuation=True,
-        )
+        return audio
 
-        response = self.speech_client.recognize(config=config, audio=audio)
+    def listen(self, file_name=None, start_position=None):
+        if not self.streaming:
+            audio = self.record(file_name, start_position=start_position)
+            if audio is None:
+                return None, None
+            return audio, self.transcribe(audio)
 
-        transcript = ""
-        for result in response.results:
-            transcript += result.alternatives[0].transcript + " "
+        session = self.recognizer.start(on_result=self.on_partial_transcript)
+        audio = self.record(file_name, session, start_position)
+        result = session.finish()
+        if audio is None:
+            return None, None
+        if self.stream_offset is not None:
+            result = result.shifted(self.stream_offset)
 
-        print("transcript:", transcript)
+        print("transcript:", result.transcript)
         print("-----")
 
-        sentence_analysis = self.segment_audio(file_name, transcript)
+        return audio, result
 
-        return transcript, sentence_analysis
+    def on_partial_transcript(self, result):
+        # Lets the endpointer commit early once the streamed transcript reads as a finished answer.
+        self.endpointer.partial(result)
+        if self.on_interim_transcript is not None:
+            self.on_interim_transcript(result)
 
-    def segment_audio(self, audio_file, transcript):
-        audio = AudioSegment.from_wav(audio_file)
+    def transcribe(self, audio):
+        result = self.recognizer.recognize(audio.tobytes())
 
-        if self.rate != audio.frame_rate:
-            print(f"Warning: self.rate ({self.rate}) does not match audio frame rate ({audio.frame_rate})")
-            self.rate = audio.frame_rate
+        print("transcript:", result.transcript)
+        print("-----")
 
-        doc = self.nlp(transcript)
-        sentences = [sent.text for sent in doc.sents]
+        return result
 
-        total_audio_duration = len(audio) - (self.max_silence_duration * 1000)  # in milliseconds
-        total_word_count = sum(len(sentence.split()) for sentence in sentences)
-        avg_word_duration = total_audio_duration / total_word_count if total_word_count else 0
+    def analyze(self, audio, result):
+        sentence_analysis = self.segment_audio(audio, result.transcript, result.words, self.speech_flags)
+
+        return result.transcript, sentence_analysis
 
-        sentence_durations = [len(sentence.split()) * avg_word_duration for sentence in sentences]
+    @tracer.traced('microphone.segment_audio')
+    def segment_audio(self, audio, transcript, words=None, speech_flags=None):
+        sentences = self.nlp.sentences(transcript)
 
-        output_dir = "segments"
-        os.makedirs(output_dir, exist_ok=True)
+        if words:
+            bounds = self.bounds_from_words(sentences, words)
+        elif speech_flags and any(speech_flags):
+            bounds = self.bounds_from_vad(sentences, speech_flags)
+        else:
+            bounds = self.bounds_from_word_count(sentences, len(audio) / self.rate)
 
         segments = []
-        start_time = 0
-        sentence_analysis = []
+        start_times = []
 
-        for sentence, duration in zip(sentences, sentence_durations):
-            end_time = start_time + duration
-            segment = audio[start_time:end_time]
+        for sentence, (start_time, end_time) in zip(sentences, bounds):
+            start_sample = min(len(audio), max(0, int(start_time * self.rate)))
+            end_sample = min(len(audio), max(start_sample, int(end_time * self.rate)))
+            # A slice of the recording buffer, not a copy.
+            segment = audio[start_sample:end_sample]
             if len(segment) == 0:
                 print(f"Warning: Empty segment for sentence: {sentence}")
 
-            audio_emotion = self.detect_emotion_from_audio(segment)
-
             segments.append(segment)
-            start_time = end_time
+            start_times.append(start_sample / self.rate)
+
+        audio_emotions = self.detect_emotions_from_audio(segments)
 
+        sentence_analysis = []
+        for sentence, segment, start_time, audio_emotion in zip(sentences, segments, start_times, audio_emotions):
+            duration = len(segment) / self.rate * 1000
             sentiment = self.transcript_sentiment(sentence)
-            sentence_analysis.append((sentence, segment, duration, sentiment, audio_emotion))
+            sentence_analysis.append((sentence, segment, duration, sentiment, audio_emotion, start_time))
+
+        if self.save_segments:
+            self.save_audio_segments(sentence_analysis)
+
+        return sentence_analysis
+
+    def bounds_from_words(self, sentences, words):
+        bounds = []
+        index = 0
+        for sentence in sentences:
+            sentence_words = words[index:index + len(sentence.split())]
+            index += len(sentence.split())
+            if sentence_words:
+                bounds.append((sentence_words[0][1], sentence_words[-1][2]))
+            else:
+                end = bounds[-1][1] if bounds else 0
+                bounds.append((end, end))
+        return bounds
+
+    def bounds_from_vad(self, sentences, speech_flags):
+        # Spread the words over the frames VAD marked as speech, so pauses are not counted as talking.
+        speech_frames = [i for i, is_speech in enumerate(speech_flags) if is_speech]
+        frame_duration = self.chunk / self.rate
+        total_word_count = sum(len(sentence.split()) for sentence in sentences)
+
+        bounds = []
+        words_before = 0
+        for sentence in sentences:
+            words_after = words_before + len(sentence.split())
+            if total_word_count == 0:
+                bounds.append((0, 0))
+                continue
+            first = int(words_before / total_word_count * len(speech_frames))
+            last = max(first, int(np.ceil(words_after / total_word_count * len(speech_frames))) - 1)
+            first = min(first, len(speech_frames) - 1)
+            last = min(last, len(speech_frames) - 1)
+            bounds.append((speech_frames[first] * frame_duration, (speech_frames[last] + 1) * frame_duration))
+            words_before = words_after
+        return bounds
+
+    def bounds_from_word_count(self, sentences, audio_duration):
+        total_audio_duration = max(0, audio_duration - self.trailing_silence)
+        total_word_count = sum(len(sentence.split()) for sentence in sentences)
+        avg_word_duration = total_audio_duration / total_word_count if total_word_count else 0
+
+        bounds = []
+        start_time = 0
+        for sentence in sentences:
+            end_time = start_time + len(sentence.split()) * avg_word_duration
+            bounds.append((start_time, end_time))
+            start_time = end_time
+        return bounds
+
+    def save_audio_segments(self, sentence_analysis):
+        os.makedirs(self.segments_dir, exist_ok=True)
 
-        for i, (sentence, segment, duration, sentiment, audio_emotion) in enumerate(sentence_analysis):
+        for i, (sentence, segment, duration, sentiment, audio_emotion, start_time) in enumerate(sentence_analysis):
             try:
-                segment_path = os.path.join(output_dir, f"segment_{i}.wav")
-                
-                segment.export(segment_path, format="wav")
+                segment_path = os.path.join(self.segments_dir, f"segment_{i}.wav")
+
+                with open(segment_path, 'wb') as out:
+                    out.write(self.to_wav_bytes(segment))
 
                 print(f"Saved audio segment {i} to {segment_path} - Emotion detected: {audio_emotion}")
 
@@ -165,7 +283,14 @@ class MicrophoneModule:
                 print(f"Error saving segment {i}: {e}")
         print("-----")
 
-        return sentence_analysis
+    def to_wav_bytes(self, samples):
+        wav_bytes = BytesIO()
+        with wave.open(wav_bytes, 'wb') as wf:
+            wf.setnchannels(self.channels)
+            wf.setsampwidth(2)
+            wf.setframerate(self.rate)
+            wf.writeframes(samples.tobytes())
+        return wav_bytes.getvalue()
 
     def transcript_sentiment(self, text):
         blob = TextBlob(text)
@@ -176,50 +301,22 @@ class MicrophoneModule:
 
         return textblob_sentiment
 
-    def detect_emotion_from_audio(self, audio_segment, api_url='http://127.0.0.1:8000/emotion_recognition'):
-        try:
-            audio_bytes = BytesIO()
-            audio_segment.export(audio_bytes, format='wav')
-            audio_bytes.seek(0)
-            files = {'audio_file': ('audio.wav', audio_bytes, 'audio/wav')}
-
-            os.environ['no_proxy'] = '127.0.0.1,localhost'
-            response = requests.post(api_url, files=files)
-
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    'emotion': result['emotion'],
-                    'confidence': result['confidence']
-                }
-            else:
-                return {
-                    'error': f'API request failed with status code {response.status_code}',
-                    'message': response.text
-                }
-        except Exception as e:
-            return {'error': str(e)}
+    @tracer.traced('microphone.detect_emotion_from_audio')
+    def detect_emotion_from_audio(self, audio_segment):
+        return self.emotion_client.detect(self.to_wav_bytes(audio_segment))
 
-    def delete_audio_files(self):
-        try:
-            # Delete segments directory
-            if os.path.exists("segments"):
-                shutil.rmtree("segments")
-                print("Deleted segments directory")
-            else:
-                print("Segments directory not found")
+    @tracer.traced('microphone.detect_emotions_from_audio')
+    def detect_emotions_from_audio(self, audio_segments):
+        return self.emotion_client.detect_many([self.to_wav_bytes(segment) for segment in audio_segments])
 
-            # Delete output.wav file
-            if os.path.exists(self.output_filename):
-                os.remove(self.output_filename)
-                print(f"Deleted output file: {self.output_filename}")
-            else:
-                print(f"Output file not found: {self.output_filename}")
-        except Exception as e:
-            print(f"Error deleting audio files: {str(e)}")
+    def stop_recording(self):
+        with self._recording_lock:
+            self._is_recording = False
 
     def close(self):
-        self.p.terminate()
+        # PyAudio is shared through the registry and terminated there.
+        self.capture.stop()
+        self.emotion_client.close()
 #
 #
 #
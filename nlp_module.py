@@ -0,0 +1,69 @@
+import time
+from registry_module import NER_EXCLUDE, SPACY_MODEL, registry
+
+class NLPService:
+    def __init__(self, model=SPACY_MODEL, batch_size=32):
+        self.model = model
+        self.batch_size = batch_size
+
+    @property
+    def sentencizer(self):
+        return registry.get('sentencizer')
+
+    @property
+    def ner(self):
+        return registry.get('spacy', self.model, NER_EXCLUDE)
+
+    def sentences(self, text):
+        return [sent.text for sent in self.sentencizer(text).sents]
+
+    def sentences_many(self, texts):
+        return [[sent.text for sent in doc.sents] for doc in self.sentencizer.pipe(texts, batch_size=self.batch_size)]
+
+    def person_name(self, text):
+        return self._first_person(self.ner(text))
+
+    def person_names(self, texts):
+        return [self._first_person(doc) for doc in self.ner.pipe(texts, batch_size=self.batch_size)]
+
+    def _first_person(self, doc):
+        for ent in doc.ents:
+            if ent.label_ == "PERSON":
+                return ent.text
+        return None
+
+def benchmark(texts, runs=5):
+    service = NLPService()
+    full = registry.get('spacy', service.model)
+    pipelines = {
+        'full pipeline': lambda: [full(text) for text in texts],
+        'sentencizer': lambda: [service.sentences(text) for text in texts],
+        'sentencizer (batched)': lambda: service.sentences_many(texts),
+        'ner': lambda: [service.person_name(text) for text in texts],
+        'ner (batched)': lambda: service.person_names(texts),
+    }
+
+    results = {}
+    for name, run in pipelines.items():
+        # First call pays for loading the pipeline, which is not what we are measuring.
+        run()
+        start = time.perf_counter()
+        for _ in range(runs):
+            run()
+        results[name] = (time.perf_counter() - start) * 1000 / (runs * len(texts))
+    return results
+
+if __name__ == "__main__":
+    transcripts = [
+        "My name is Maria. I moved here from Lisbon last year.",
+        "I spent the weekend hiking with my brother. It rained the whole time, but we still had fun.",
+        "Honestly I don't remember. Maybe it was the summer after I finished school?",
+        "Call me Sam.",
+    ] * 8
+    for name, milliseconds in benchmark(transcripts).items():
+        print(f"{name}: {milliseconds:.2f} ms per turn")
+#
+#
+#
+#
+#
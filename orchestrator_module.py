@@ -0,0 +1,141 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tracing_module import tracer
+
+GOODBYE_PHRASE = "goodbye"
+# Seconds to wait for queued database writes when the conversation ends.
+FLUSH_TIMEOUT = 10
+
+WELCOME_BACK = "Welcome back!"
+GREETING = "Hello there, I am Ioanna! What is your name?"
+FACE_NOT_RECOGNIZED = "i couldn't recognize your face, please try again!"
+FAREWELL = "Goodbye!"
+# Asked when the model sends nothing back, so the user is never answered with silence.
+FALLBACK_QUESTION = "Sorry, I lost my train of thought. What would you like to talk about?"
+# Everything Ioanna says word for word, so the speaker can synthesise it ahead of time.
+SYSTEM_PHRASES = [WELCOME_BACK, GREETING, FACE_NOT_RECOGNIZED, FAREWELL, FALLBACK_QUESTION]
+
+class ConversationOrchestrator:
+    def __init__(self, conversation, max_workers=6):
+        self.conversation = conversation
+        self.max_workers = max_workers
+        self.executor = None
+
+    def run(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='conversation')
+        try:
+            asyncio.run(self.main())
+        finally:
+            self.executor.shutdown(wait=True)
+
+    async def call(self, func, *args):
+        # Blocking module calls run on the worker pool so independent stages can overlap.
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def main(self):
+        c = self.conversation
+        print("-----")
+        c.speaker.prewarm(c.system_phrases)
+        if c.duplex:
+            c.microphone.keep_stream_open = True
+            await self.call(c.microphone.capture.start)
+        await asyncio.gather(self.call(c.camera.start_camera), self.call(c.face_index.load), self.call(c.ensure_indexes))
+
+        user = await self.call(c.get_current_user)
+        if user is None:
+            return
+
+        while c.is_running():
+            tracer.begin_turn()
+            with tracer.span('turn'):
+                with tracer.span('turn.ask'):
+                    speaking, barge_in = await self.ask(user)
+
+                with tracer.span('turn.listen'):
+                    transcript, merged_sentences = await self.listen(barge_in)
+                # After a barge-in the question may still be playing (ducked) or winding down (stopped).
+                question = await speaking
+                c.conversation_history.append({'role': 'user', 'content': transcript})
+                c.new_message.emit({'role': 'user', 'content': transcript})
+
+                print("-----")
+                details = c.memorise_sentences(merged_sentences)
+                # Database writes are only queued here and happen behind the next question's generation.
+                c.add_to_user_memories(user, question, details)
+            print("-----")
+            tracer.end_turn()
+
+            if GOODBYE_PHRASE in transcript.lower():
+                break
+
+        _, saved = await asyncio.gather(self.call(c.speaker.synthesize_speech, FAREWELL), self.call(c.persistence.flush, FLUSH_TIMEOUT))
+        if not saved:
+            print("Some of this conversation could not be saved to the database")
+
+    async def ask(self, user):
+        # Returns the task speaking the question and, if the user cut in, the ring position their answer starts at.
+        c = self.conversation
+        speaking = asyncio.ensure_future(self.speak_question(user))
+        if not c.duplex:
+            await asyncio.wait([speaking])
+            return speaking, None
+
+        stop_watching = threading.Event()
+        barge_in_task = asyncio.ensure_future(self.call(c.barge_in.watch, stop_watching))
+        await asyncio.wait([speaking, barge_in_task], return_when=asyncio.FIRST_COMPLETED)
+        if barge_in_task.done() and barge_in_task.result() is not None:
+            # Listen straight away; a ducked question carries on playing underneath.
+            return speaking, barge_in_task.result()
+
+        await asyncio.wait([speaking])
+        stop_watching.set()
+        return speaking, await barge_in_task
+
+    async def speak_question(self, user):
+        c = self.conversation
+        utterance = await self.call(c.speaker.speak_stream, c.ioanna.stream_question(user, FALLBACK_QUESTION))
+        # Ioanna records its own question in the history; appending it here too duplicated every turn.
+        question = utterance.text
+        if question:
+            c.new_message.emit({'role': 'assistant', 'content': question})
+        await self.call(utterance.wait)
+        return question
+
+    async def listen(self, start_position=None):
+        c = self.conversation
+        stop_capture = threading.Event()
+        facial_task = asyncio.ensure_future(self.call(c.capture_facial_emotions, stop_capture))
+
+        try:
+            audio, result = await self.call(c.microphone.listen, None, start_position)
+        finally:
+            stop_capture.set()
+
+        recording_started = c.microphone.recording_started
+        if audio is None:
+            await facial_task
+            return "", []
+
+        # Audio emotion requests for the sentences run while facial emotion capture winds down.
+        (transcript, sentences), facial_emotions = await asyncio.gather(
+            self.call(c.microphone.analyze, audio, result),
+            facial_task,
+        )
+        facial_emotions += await self.call(c.sentence_frame_emotions, facial_emotions, sentences, recording_started)
+
+        print("Emotions detected during recording:")
+        for emotions, timestamp in facial_emotions:
+            print(f"{emotions} at {timestamp}")
+        print("-----")
+
+        matched_data = c.match_facial_emotions_to_sentences(facial_emotions, sentences, recording_started)
+        merged_sentences = c.merge_emotion_data(sentences, matched_data)
+        c.print_merge_details(merged_sentences)
+
+        return transcript, merged_sentences
+#
+#
+#
+#
+#
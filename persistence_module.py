@@ -0,0 +1,187 @@
+import datetime
+import queue
+import time
+from threading import Event, Lock, Thread
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, WTimeoutError
+from tracing_module import tracer
+
+TRANSIENT_ERRORS = (ConnectionFailure, WTimeoutError)
+DUPLICATE_KEY = 11000
+
+class PersistenceQueue:
+    def __init__(self, max_batch=100, flush_interval=0.5, retries=5):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self._queue = queue.Queue()
+        self._thread = None
+        # (collection name, error) for every write that was given up on.
+        self.failures = []
+        self._reported = 0
+        self._lock = Lock()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def insert(self, collection, document):
+        # Give the document its _id up front so a retried insert is recognised as a duplicate.
+        document.setdefault('_id', ObjectId())
+        self.start()
+        self._queue.put(('insert', collection, document))
+
+    def update(self, collection, filter, update, upsert=False):
+        self.start()
+        self._queue.put(('update', collection, filter, update, upsert))
+
+    def flush(self, timeout=None):
+        # True once everything queued so far is written and nothing has failed since the last flush.
+        if self._thread is not None:
+            if not self._thread.is_alive():
+                print("Persistence worker is not running; queued writes were not saved")
+                return False
+            done = Event()
+            self._queue.put(('flush', done))
+            if not done.wait(timeout):
+                print("Timed out waiting for queued database writes")
+                return False
+
+        with self._lock:
+            failed = len(self.failures) > self._reported
+            self._reported = len(self.failures)
+        return not failed
+
+    def close(self, timeout=10):
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            deadline = time.time() + self.flush_interval
+            # Gather whatever else arrives shortly after, up to max_batch, so writes go out together.
+            while len(batch) < self.max_batch and batch[-1] is not None and batch[-1][0] != 'flush':
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+
+            self._write(batch)
+
+            for item in batch:
+                if item[0] == 'flush':
+                    item[1].set()
+            if stop:
+                return
+
+    def _write(self, batch):
+        pending = {}
+        for item in batch:
+            if item[0] == 'flush':
+                continue
+            collection = item[1]
+            key = (collection.database.name, collection.name)
+            collection, operations = pending.setdefault(key, (collection, []))
+            self._coalesce(operations, item)
+
+        for collection, operations in pending.values():
+            self._bulk_write(collection, [self._operation(op) for op in operations])
+
+    def _coalesce(self, operations, item):
+        if item[0] == 'update' and operations:
+            previous = operations[-1]
+            # Back-to-back $set updates of the same document become a single update.
+            if (previous[0] == 'update' and previous[2] == item[2] and previous[4] == item[4]
+                    and set(previous[3]) == {'$set'} and set(item[3]) == {'$set'}):
+                merged = dict(previous[3]['$set'])
+                merged.update(item[3]['$set'])
+                operations[-1] = ('update', previous[1], previous[2], {'$set': merged}, previous[4])
+                return
+        operations.append(item)
+
+    def _operation(self, item):
+        if item[0] == 'insert':
+            return InsertOne(item[2])
+        return UpdateOne(item[2], item[3], upsert=item[4])
+
+    def _bulk_write(self, collection, operations):
+        with tracer.span('mongo.bulk_write', collection=collection.name, operations=len(operations)):
+            self._bulk_write_with_retries(collection, operations)
+
+    def _bulk_write_with_retries(self, collection, operations):
+        attempt = 0
+        while operations:
+            try:
+                collection.bulk_write(operations, ordered=True)
+                return
+            except BulkWriteError as e:
+                # Ordered writes stop at the first error; skip the failed operation and carry on with the rest.
+                error = e.details['writeErrors'][0]
+                if error.get('code') != DUPLICATE_KEY:
+                    self._failed(collection, error.get('errmsg'))
+                operations = operations[error['index'] + 1:]
+            except TRANSIENT_ERRORS as e:
+                attempt += 1
+                if attempt > self.retries:
+                    self._failed(collection, f"gave up on {len(operations)} operations: {str(e)}")
+                    return
+                print(f"Transient database error, retrying ({attempt}/{self.retries}): {str(e)}")
+                time.sleep(min(0.1 * 2 ** attempt, 5))
+            except Exception as e:
+                self._failed(collection, str(e))
+                return
+
+    def _failed(self, collection, error):
+        print(f"Error writing to {collection.name}: {error}")
+        with self._lock:
+            self.failures.append((collection.name, error))
+
+def migrate_embedded_memories(users, memories, user):
+    # Users created before memories had their own collection keep them in an ever-growing array.
+    # Runs synchronously, and the array is only removed once every memory is in the memories collection.
+    embedded = user.pop('memories', None)
+    if embedded is None:
+        return 0
+
+    migrated_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(milliseconds=len(embedded))
+    documents = [{
+        'user_id': user['_id'],
+        'question': memory.get('question'),
+        'answers': memory.get('answers', []),
+        'created_at': migrated_at + datetime.timedelta(milliseconds=i),
+        'migrated': True
+    } for i, memory in enumerate(embedded)]
+
+    try:
+        # Clears out an earlier attempt that stopped halfway, so trying again never duplicates memories.
+        memories.delete_many({'user_id': user['_id'], 'migrated': True})
+        if documents:
+            memories.insert_many(documents, ordered=True)
+        users.update_one({'_id': user['_id']}, {'$unset': {'memories': ""}})
+    except Exception as e:
+        print(f"Error migrating memories, keeping them on the user to try again next time: {str(e)}")
+        return 0
+    return len(documents)
+#
+#
+#
+#
+#
@@ -0,0 +1,91 @@
+import re
+from threading import Lock
+from memory_retrieval_module import estimate_tokens
+
+FIRST_TURN_INSTRUCTIONS = '''You are speaking to {user_name}.
+Address them by name and try to get to know them by asking about random life experiences.
+Do not bring up the memories below unless you are answering a question.
+Keep your messages brief and concise, 25 words maximum.
+This conversation is happening via text to speech, so use emotional cues to show genuine interest.
+Ask a question to start the conversation.'''
+
+FOLLOW_UP_INSTRUCTIONS = '''You are continuing a conversation with {user_name}.
+Based on the context below, generate a follow-up question or comment that maintains the flow of the conversation.
+Keep your response brief and concise, 25 words maximum.
+Show genuine interest in their responses and ask for more details when appropriate.'''
+
+def truncate(text, max_tokens):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4].rsplit(' ', 1)[0] + "..."
+
+def extractive_summary(message, max_tokens=30):
+    # First sentence of the message, which is usually the question or the gist of the answer.
+    first_sentence = re.split(r'(?<=[.!?])\s+', message['content'].strip(), maxsplit=1)[0]
+    return f"{message['role']}: {truncate(first_sentence, max_tokens)}"
+
+class PromptBuilder:
+    def __init__(self, token_budget=800, recent_messages=6, summary_budget=200, message_budget=120, summarizer=None):
+        self.token_budget = token_budget
+        self.recent_messages = recent_messages
+        self.summary_budget = summary_budget
+        self.message_budget = message_budget
+        self.summarizer = summarizer if summarizer is not None else extractive_summary
+        self.summary_lines = []
+        self.summarized = 0
+        self._lock = Lock()
+
+    def dedupe(self, history):
+        messages = []
+        for message in history:
+            if not message.get('content'):
+                continue
+            if messages and messages[-1]['role'] == message['role'] and messages[-1]['content'] == message['content']:
+                continue
+            messages.append(message)
+        return messages
+
+    def update_summary(self, older_messages):
+        # Only messages that have just left the recent window are summarised; earlier lines are kept as they are.
+        for message in older_messages[self.summarized:]:
+            self.summary_lines.append(self.summarizer(message))
+        self.summarized = max(self.summarized, len(older_messages))
+
+        while len(self.summary_lines) > 1 and estimate_tokens("\n".join(self.summary_lines)) > self.summary_budget:
+            self.summary_lines.pop(0)
+
+    def reset(self):
+        with self._lock:
+            self.summary_lines = []
+            self.summarized = 0
+
+    def format_memories(self, memories):
+        return "\n".join(f"- Q: {memory.get('question')} A: {' '.join(memory.get('answers') or [])}" for memory in memories)
+
+    def build(self, user_name, history, memories=()):
+        with self._lock:
+            messages = self.dedupe(history)
+            split = max(0, len(messages) - self.recent_messages)
+            self.update_summary(messages[:split])
+            recent = [f"{message['role']}: {truncate(message['content'], self.message_budget)}" for message in messages[split:]]
+
+            instructions = (FOLLOW_UP_INSTRUCTIONS if messages else FIRST_TURN_INSTRUCTIONS).format(user_name=user_name)
+            sections = [instructions]
+            if memories:
+                sections.append("Memories from earlier conversations:\n" + self.format_memories(memories))
+            if self.summary_lines:
+                sections.append("Summary of the conversation so far:\n" + "\n".join(self.summary_lines))
+
+            # Drop the oldest recent messages first if the whole prompt would go over budget.
+            fixed_cost = estimate_tokens("\n\n".join(sections))
+            while recent and fixed_cost + estimate_tokens("\n".join(recent)) > self.token_budget:
+                recent.pop(0)
+            if recent:
+                sections.append("Recent conversation:\n" + "\n".join(recent))
+
+            return "\n\n".join(sections)
+#
+#
+#
+#
+#
@@ -0,0 +1,200 @@
+import queue
+import time
+from threading import Lock, Thread
+from google.cloud import speech
+from tracing_module import tracer
+
+class RecognitionResult:
+    def __init__(self, transcript="", words=None, is_final=True):
+        self.transcript = transcript
+        self.words = words if words is not None else []
+        self.is_final = is_final
+
+    def shifted(self, offset):
+        words = [(word, start + offset, end + offset) for word, start, end in self.words]
+        return RecognitionResult(self.transcript, words, self.is_final)
+
+class GoogleSpeechRecognizer:
+    def __init__(self, speech_client, rate, language_code="en-US"):
+        self.speech_client = speech_client
+        self.rate = rate
+        self.language_code = language_code
+
+    def recognition_config(self):
+        return speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=self.rate,
+            language_code=self.language_code,
+            enable_automatic_punctuation=True,
+            enable_word_time_offsets=True,
+        )
+
+    @tracer.traced('recognizer.recognize')
+    def recognize(self, content):
+        audio = speech.RecognitionAudio(content=content)
+        response = self.speech_client.recognize(config=self.recognition_config(), audio=audio)
+
+        transcript = ""
+        words = []
+        for result in response.results:
+            alternative = result.alternatives[0]
+            transcript += alternative.transcript + " "
+            words.extend(word_offsets(alternative))
+
+        return RecognitionResult(transcript, words)
+
+    def start(self, on_result=None):
+        return GoogleStreamingSession(self, on_result)
+
+class GoogleStreamingSession:
+    def __init__(self, recognizer, on_result=None):
+        self.recognizer = recognizer
+        self.on_result = on_result
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = Lock()
+        self._final_transcript = ""
+        self._final_words = []
+        self._error = None
+
+    def feed(self, chunk):
+        if self._thread is None:
+            # Start lazily so a turn without any speech never opens a stream.
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._queue.put(chunk)
+
+    @tracer.traced('recognizer.finish')
+    def finish(self, timeout=10):
+        if self._thread is None:
+            return RecognitionResult()
+
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print("Streaming recognition did not finish in time, using partial transcript")
+        if self._error is not None:
+            print(f"An error occurred during streaming recognition: {self._error}")
+
+        with self._lock:
+            return RecognitionResult(self._final_transcript, list(self._final_words))
+
+    def _requests(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            yield speech.StreamingRecognizeRequest(audio_content=chunk)
+
+    def _run(self):
+        streaming_config = speech.StreamingRecognitionConfig(
+            config=self.recognizer.recognition_config(),
+            interim_results=True,
+        )
+
+        try:
+            responses = self.recognizer.speech_client.streaming_recognize(config=streaming_config, requests=self._requests())
+            for response in responses:
+                interim = ""
+                for result in response.results:
+                    alternative = result.alternatives[0]
+                    if result.is_final:
+                        with self._lock:
+                            self._final_transcript += alternative.transcript + " "
+                            self._final_words.extend(word_offsets(alternative))
+                    else:
+                        interim += alternative.transcript
+
+                if self.on_result is not None:
+                    with self._lock:
+                        transcript = self._final_transcript + interim
+                        words = list(self._final_words)
+                    self.on_result(RecognitionResult(transcript, words, is_final=not interim))
+        except Exception as e:
+            self._error = e
+
+class StubRecognizer:
+    def __init__(self, transcript="", words=None, rate=16000, sample_width=2):
+        self.transcript = transcript
+        self.words = words
+        self.rate = rate
+        self.sample_width = sample_width
+
+    def recognize(self, content):
+        return RecognitionResult(self.transcript, self._word_offsets(len(content)))
+
+    def start(self, on_result=None):
+        return StubSession(self, on_result)
+
+    def _word_offsets(self, num_bytes):
+        if self.words is not None:
+            return list(self.words)
+
+        # Spread the words evenly over the audio that was actually fed.
+        tokens = self.transcript.split()
+        duration = num_bytes / (self.rate * self.sample_width)
+        step = duration / len(tokens) if tokens else 0
+        return [(token, i * step, (i + 1) * step) for i, token in enumerate(tokens)]
+
+class StubSession:
+    def __init__(self, recognizer, on_result=None):
+        self.recognizer = recognizer
+        self.on_result = on_result
+        self.num_bytes = 0
+
+    def feed(self, chunk):
+        self.num_bytes += len(chunk)
+
+    def finish(self, timeout=10):
+        result = RecognitionResult(self.recognizer.transcript, self.recognizer._word_offsets(self.num_bytes))
+        if self.on_result is not None:
+            self.on_result(result)
+        return result
+
+class ReplayRecognizer:
+    def __init__(self, turns, latency=0.0, on_exhausted=None):
+        # turns hold what the live recognizer returned: transcript, words and the stream offset they were shifted by.
+        self.turns = list(turns)
+        self.latency = latency
+        self.on_exhausted = on_exhausted
+        self.index = 0
+        self._lock = Lock()
+
+    def next_turn(self):
+        with self._lock:
+            if self.index >= len(self.turns):
+                if self.on_exhausted is not None:
+                    self.on_exhausted()
+                return {'transcript': "goodbye", 'words': [], 'stream_offset': None}
+            turn = self.turns[self.index]
+            self.index += 1
+            return turn
+
+    def recognize(self, content):
+        turn = self.next_turn()
+        if self.latency:
+            time.sleep(self.latency)
+        return RecognitionResult(turn['transcript'], [tuple(word) for word in turn['words']])
+
+    def start(self, on_result=None):
+        return ReplaySession(self, on_result)
+
+class ReplaySession(StubSession):
+    def finish(self, timeout=10):
+        turn = self.recognizer.next_turn()
+        if self.recognizer.latency:
+            time.sleep(self.recognizer.latency)
+        # listen() shifts streaming results by the offset it measures, so hand back the unshifted words.
+        offset = turn['stream_offset'] or 0.0
+        result = RecognitionResult(turn['transcript'], [(word, start - offset, end - offset) for word, start, end in turn['words']])
+        if self.on_result is not None:
+            self.on_result(result)
+        return result
+
+def word_offsets(alternative):
+    return [(word.word, word.start_time.total_seconds(), word.end_time.total_seconds()) for word in alternative.words]
+#
+#
+#
+#
+#
@@ -0,0 +1,153 @@
+from threading import Lock, Thread
+
+SPEECH_CREDENTIALS = './resources/gcp_speech_and_text_credentials.json'
+VISION_CREDENTIALS = './resources/gcp_vision_credentials.json'
+SHAPE_PREDICTOR = './resources/shape_predictor_68_face_landmarks.dat'
+FACE_RECOGNITION_MODEL = './resources/dlib_face_recognition_resnet_model_v1.dat'
+EMOTION_MODEL = './resources/emotion_model.hdf5'
+SPACY_MODEL = 'en_core_web_sm'
+# Name extraction only needs the entity recogniser, which in the small English model carries its own embedding layer.
+NER_EXCLUDE = ('tok2vec', 'tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'senter')
+
+class ResourceRegistry:
+    def __init__(self):
+        self._factories = {}
+        self._closers = {}
+        self._resources = {}
+        self._locks = {}
+        self._lock = Lock()
+
+    def register(self, name, factory, close=None):
+        with self._lock:
+            self._factories[name] = factory
+            if close is not None:
+                self._closers[name] = close
+
+    def get(self, name, *args):
+        key = (name,) + args
+        resource = self._resources.get(key)
+        if resource is not None:
+            return resource
+
+        with self._lock:
+            lock = self._locks.setdefault(key, Lock())
+            factory = self._factories[name]
+
+        # Per-resource lock: a caller that needs a model waits for a warm-up already loading it instead of loading it twice.
+        with lock:
+            resource = self._resources.get(key)
+            if resource is None:
+                resource = factory(*args)
+                self._resources[key] = resource
+            return resource
+
+    def provide(self, name, resource, *args):
+        # Hand in an already built resource, e.g. a local fake when replaying a recorded session.
+        with self._lock:
+            self._resources[(name,) + args] = resource
+
+    def loaded(self, name, *args):
+        return ((name,) + args) in self._resources
+
+    def warm_up(self, names):
+        def load():
+            for key in names:
+                try:
+                    self.get(*key)
+                except Exception as e:
+                    print(f"Error warming up {key[0]}: {e}")
+
+        thread = Thread(target=load, daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        with self._lock:
+            resources = list(self._resources.items())
+            self._resources.clear()
+        for key, resource in resources:
+            close = self._closers.get(key[0])
+            if close is not None:
+                try:
+                    close(resource)
+                except Exception as e:
+                    print(f"Error closing {key[0]}: {e}")
+
+def load_spacy(name=SPACY_MODEL, exclude=()):
+    import spacy
+    try:
+        return spacy.load(name, exclude=list(exclude))
+    except OSError:
+        print('Downloading language model for the spaCy POS tagger')
+        from spacy.cli import download
+        download(name)
+        return spacy.load(name, exclude=list(exclude))
+
+def create_sentencizer(language='en'):
+    import spacy
+    nlp = spacy.blank(language)
+    nlp.add_pipe('sentencizer')
+    return nlp
+
+def create_pyaudio():
+    import pyaudio
+    return pyaudio.PyAudio()
+
+def create_speech_client(credentials_path=SPEECH_CREDENTIALS):
+    from google.cloud import speech
+    return speech.SpeechClient.from_service_account_json(credentials_path)
+
+def create_tts_client(credentials_path=SPEECH_CREDENTIALS):
+    from google.cloud import texttospeech
+    return texttospeech.TextToSpeechClient.from_service_account_json(credentials_path)
+
+def create_vision_client(credentials_path=VISION_CREDENTIALS):
+    from google.cloud import vision
+    return vision.ImageAnnotatorClient.from_service_account_json(credentials_path)
+
+def create_face_detector():
+    import dlib
+    return dlib.get_frontal_face_detector()
+
+def create_shape_predictor(path=SHAPE_PREDICTOR):
+    import dlib
+    return dlib.shape_predictor(path)
+
+def create_face_recognition_model(path=FACE_RECOGNITION_MODEL):
+    import dlib
+    return dlib.face_recognition_model_v1(path)
+
+def create_emotion_model(path=EMOTION_MODEL):
+    from emotion_model_module import load_emotion_model
+    return load_emotion_model(path)
+
+registry = ResourceRegistry()
+registry.register('spacy', load_spacy)
+registry.register('sentencizer', create_sentencizer)
+registry.register('pyaudio', create_pyaudio, close=lambda p: p.terminate())
+registry.register('speech_client', create_speech_client)
+registry.register('tts_client', create_tts_client)
+registry.register('vision_client', create_vision_client)
+registry.register('face_detector', create_face_detector)
+registry.register('shape_predictor', create_shape_predictor)
+registry.register('face_recognition_model', create_face_recognition_model)
+registry.register('emotion_model', create_emotion_model)
+
+# Loaded in the background once the window is up, roughly in the order the conversation needs them.
+# Arguments are part of the key, so these match what the modules ask for with their default paths.
+STARTUP_RESOURCES = [
+    ('face_detector',),
+    ('shape_predictor', SHAPE_PREDICTOR),
+    ('face_recognition_model', FACE_RECOGNITION_MODEL),
+    ('emotion_model', EMOTION_MODEL),
+    ('pyaudio',),
+    ('tts_client', SPEECH_CREDENTIALS),
+    ('speech_client', SPEECH_CREDENTIALS),
+    ('sentencizer',),
+    ('spacy', SPACY_MODEL, NER_EXCLUDE),
+]
+#
+#
+#
+#
+#
@@ -0,0 +1,243 @@
+import datetime
+import json
+import shutil
+import tempfile
+import time
+import zipfile
+from threading import Lock
+from bson import ObjectId
+from conversation_module import ConversationModule
+from emotion_backend_module import LocalEmotionBackend
+from emotion_client_module import AudioEmotionClient
+from fake_backends import FakeEmotionServer, FakeMistralServer, FakeMongoClient, FakePyAudio, FakeTTSClient, ReplayCapture
+from recognizer_module import ReplayRecognizer
+from registry_module import registry
+from tts_cache_module import TTSCache
+
+class LatencyProfile:
+    # Seconds added by each fake backend; the defaults are roughly what the real services take.
+    def __init__(self, mistral=0.4, mistral_token=0.02, tts=0.25, recognizer=0.3, emotion=0.15, mongo=0.01):
+        self.mistral = mistral
+        self.mistral_token = mistral_token
+        self.tts = tts
+        self.recognizer = recognizer
+        self.emotion = emotion
+        self.mongo = mongo
+
+    @classmethod
+    def none(cls):
+        return cls(0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+class Session:
+    def __init__(self, frames=None, turns=None, questions=None, emotions=None, user=None, memories=None, rate=16000):
+        self.frames = frames if frames is not None else []
+        self.turns = turns if turns is not None else []
+        self.questions = questions if questions is not None else []
+        self.emotions = emotions if emotions is not None else []
+        self.user = user
+        self.memories = memories if memories is not None else []
+        self.rate = rate
+
+    def save(self, path):
+        manifest = {
+            'rate': self.rate,
+            'frames': [offset for offset, _ in self.frames],
+            'turns': [{key: value for key, value in turn.items() if key != 'audio'} for turn in self.turns],
+            'questions': self.questions,
+            'emotions': self.emotions,
+            'user': self.user,
+            'memories': self.memories,
+        }
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('manifest.json', json.dumps(manifest))
+            for i, (_, data) in enumerate(self.frames):
+                archive.writestr(f"frames/{i:06d}.jpg", data)
+            for i, turn in enumerate(self.turns):
+                archive.writestr(f"audio/{i:03d}.pcm", turn['audio'])
+
+    @classmethod
+    def load(cls, path):
+        with zipfile.ZipFile(path) as archive:
+            manifest = json.loads(archive.read('manifest.json'))
+            frames = [(offset, archive.read(f"frames/{i:06d}.jpg")) for i, offset in enumerate(manifest['frames'])]
+            turns = []
+            for i, turn in enumerate(manifest['turns']):
+                turn = dict(turn, audio=archive.read(f"audio/{i:03d}.pcm"))
+                turn['words'] = [tuple(word) for word in turn['words']]
+                turns.append(turn)
+        return cls(frames, turns, manifest['questions'], manifest['emotions'], manifest['user'], manifest['memories'], manifest['rate'])
+
+class SessionRecorder:
+    def __init__(self, conversation, path, frame_interval=0.1):
+        self.conversation = conversation
+        self.path = path
+        self.frame_interval = frame_interval
+        self.session = Session(rate=conversation.microphone.rate)
+        self.started = None
+        self._last_frame = 0
+        self._lock = Lock()
+
+    def attach(self):
+        # Wraps the live modules' entry points on the instances, so the rest of the code runs unchanged.
+        c = self.conversation
+        self.started = time.time()
+        self._wrap(c.camera.frame_buffer, 'publish', self.record_frame)
+        self._wrap(c.microphone, 'listen', self.record_turn)
+        self._wrap(c.microphone.emotion_client, 'detect_many', self.record_emotions)
+        self._wrap(c.ioanna, 'record_question', self.record_question)
+        self._wrap(c, 'check_face_encoding', self.record_user)
+        self._wrap(c, 'cleanup', self.record_cleanup)
+        return self
+
+    def _wrap(self, target, name, recorder):
+        original = getattr(target, name)
+        setattr(target, name, lambda *args, **kwargs: recorder(original, *args, **kwargs))
+
+    def record_frame(self, publish, frame, timestamp):
+        import cv2
+        sequence = publish(frame, timestamp)
+        if timestamp - self._last_frame >= self.frame_interval:
+            self._last_frame = timestamp
+            ok, jpeg = cv2.imencode('.jpg', frame)
+            if ok:
+                with self._lock:
+                    self.session.frames.append((timestamp - self.started, jpeg.tobytes()))
+        return sequence
+
+    def record_turn(self, listen, *args, **kwargs):
+        audio, result = listen(*args, **kwargs)
+        if audio is not None:
+            with self._lock:
+                self.session.turns.append({
+                    'audio': audio.tobytes(),
+                    'transcript': result.transcript,
+                    'words': [list(word) for word in result.words],
+                    'stream_offset': self.conversation.microphone.stream_offset,
+                })
+        return audio, result
+
+    def record_emotions(self, detect_many, wav_list):
+        # One list per turn, in segment order; failed detections are left for the replay's default answer.
+        responses = detect_many(wav_list)
+        with self._lock:
+            self.session.emotions.append([None if 'error' in response else response for response in responses])
+        return responses
+
+    def record_question(self, record_question, question):
+        with self._lock:
+            self.session.questions.append(question)
+        return record_question(question)
+
+    def record_user(self, check_face_encoding, face_encoding):
+        match_found, user = check_face_encoding(face_encoding)
+        if match_found:
+            # The stored document has the exemplars the face index needs; the matched one leaves them out.
+            stored = self.conversation.users_collection.find_one({'_id': user['_id']}) or user
+            self.session.user = {
+                '_id': str(stored['_id']),
+                'user_name': stored.get('user_name'),
+                'face_encoding': stored.get('face_encoding'),
+                'face_exemplars': stored.get('face_exemplars', []),
+            }
+            self.session.memories = [{
+                'question': memory.get('question'),
+                'answers': memory.get('answers', []),
+                'created_at': memory['created_at'].isoformat() if memory.get('created_at') else None,
+            } for memory in user.get('memories', [])]
+        return match_found, user
+
+    def record_cleanup(self, cleanup):
+        try:
+            cleanup()
+        finally:
+            with self._lock:
+                self.session.save(self.path)
+            print(f"Recorded session saved to {self.path}")
+
+class ReplayEmotionClient(AudioEmotionClient):
+    # Tags every request with its turn and segment, which is how the recorded answers are keyed.
+    def __init__(self, api_url):
+        super().__init__(api_url=api_url)
+        self.turn = 0
+
+    def detect_many(self, wav_list):
+        turn = self.turn
+        self.turn += 1
+        keys = [f"{turn}/{segment}" for segment in range(len(wav_list))]
+        return list(self.executor.map(lambda wav_bytes, key: self.detect(wav_bytes, headers={'X-Replay-Key': key}), wav_list, keys))
+
+def recorded_emotions(session):
+    return {
+        f"{turn}/{segment}": response
+        for turn, responses in enumerate(session.emotions)
+        for segment, response in enumerate(responses)
+        if response is not None
+    }
+
+class Replay:
+    def __init__(self, session, latency=None, speed=1.0):
+        self.session = session
+        self.latency = latency if latency is not None else LatencyProfile()
+        self.speed = speed
+        self.servers = []
+        self.cache_dir = None
+        self.conversation = None
+
+    def build(self):
+        latency = self.latency
+        emotion_server = FakeEmotionServer(latency=latency.emotion, keyed_responses=recorded_emotions(self.session)).start()
+        mistral_server = FakeMistralServer(latency=latency.mistral, token_latency=latency.mistral_token, replies=self.session.questions).start()
+        self.servers = [emotion_server, mistral_server]
+
+        c = ConversationModule(mongo_client=FakeMongoClient(latency=latency.mongo))
+        c.close_registry = False
+        self.seed(c)
+
+        registry.provide('pyaudio', FakePyAudio([turn['audio'] for turn in self.session.turns], speed=self.speed))
+        registry.provide('tts_client', FakeTTSClient(latency=latency.tts), c.speaker.credentials_path)
+        frames = self.session.frames
+        c.camera.capture_factory = lambda index: ReplayCapture(frames, speed=self.speed)
+        # Facial emotions come from the local model so a replay never calls Google Vision.
+        c.camera.emotion_backend = LocalEmotionBackend(c.camera)
+        c.microphone.recognizer = ReplayRecognizer(self.session.turns, latency=latency.recognizer, on_exhausted=c.stop)
+        c.microphone.emotion_client.close()
+        c.microphone.emotion_client = ReplayEmotionClient(emotion_server.url)
+        c.ioanna.api_url = mistral_server.url
+        # A fresh cache per run so every replay synthesises the same sentences.
+        self.cache_dir = tempfile.mkdtemp(prefix='ioanna-tts-')
+        c.speaker.cache = TTSCache(cache_dir=self.cache_dir)
+
+        self.conversation = c
+        return c
+
+    def seed(self, c):
+        user = self.session.user
+        if user is None:
+            return
+        user_id = ObjectId(user['_id'])
+        c.users_collection.insert_many([dict(user, _id=user_id)])
+        if not self.session.memories:
+            return
+        c.memories_collection.insert_many([{
+            '_id': ObjectId(),
+            'user_id': user_id,
+            'question': memory['question'],
+            'answers': memory['answers'],
+            'created_at': datetime.datetime.fromisoformat(memory['created_at']) if memory['created_at'] else None,
+        } for memory in self.session.memories])
+
+    def run(self):
+        c = self.build()
+        try:
+            # Runs the conversation on this thread instead of starting the QThread.
+            c.run()
+        finally:
+            for server in self.servers:
+                server.stop()
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        return c
+#
+#
+#
+#
+#
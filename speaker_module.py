@@ -1,68 +1,305 @@
-import os
+import re
+import time
 import wave
-import pyaudio
+import queue
+from io import BytesIO
+import numpy as np
+from threading import Event, Lock, Thread
 from google.cloud import texttospeech
+from tts_cache_module import TTSCache
+from registry_module import registry
+from tracing_module import tracer
+
+def split_sentences(text):
+    return [sentence for sentence in re.split(r'(?<=[.!?])\s+', text.strip()) if sentence]
+
+class Utterance:
+    def __init__(self, text):
+        self.text = text
+        self.frames = []
+        self.format = None
+        self.done = Event()
+        self.cancelled = Event()
+        self.gain = 1.0
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+class PlaybackEngine:
+    def __init__(self, speaker):
+        self.speaker = speaker
+        self._synthesis_queue = queue.Queue()
+        # Bounded so synthesis only runs one sentence ahead of playback.
+        self._playback_queue = queue.Queue(maxsize=1)
+        self._lock = Lock()
+        self._threads = []
+        self._stream = None
+        self._stream_format = None
+        self._current = None
+        self._level = 0.0
+        self._level_time = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                Thread(target=self._synthesize_loop, daemon=True),
+                Thread(target=self._playback_loop, daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def speak(self, text):
+        self.start()
+        utterance = self._begin(Utterance(text))
+        for sentence in split_sentences(text):
+            self._synthesis_queue.put((utterance, sentence, None))
+        self._synthesis_queue.put((utterance, None, None))
+        return utterance
+
+    def speak_stream(self, chunks):
+        # Each chunk is queued for synthesis as soon as it arrives, so playback starts before the text is complete.
+        self.start()
+        utterance = self._begin(Utterance(""))
+        try:
+            for chunk in chunks:
+                if utterance.cancelled.is_set():
+                    # Interrupted: close the text stream so the rest of the answer is never generated.
+                    close = getattr(chunks, 'close', None)
+                    if close is not None:
+                        close()
+                    break
+                utterance.text = f"{utterance.text} {chunk}".strip()
+                for sentence in split_sentences(chunk):
+                    self._synthesis_queue.put((utterance, sentence, None))
+        finally:
+            self._synthesis_queue.put((utterance, None, None))
+        return utterance
+
+    def play(self, audio_content):
+        self.start()
+        utterance = self._begin(Utterance(None))
+        self._synthesis_queue.put((utterance, None, audio_content))
+        self._synthesis_queue.put((utterance, None, None))
+        return utterance
+
+    def _begin(self, utterance):
+        with self._lock:
+            self._current = utterance
+        return utterance
+
+    def interrupt(self):
+        # Drops whatever of the current utterance has not been played yet; its waiters are released as usual.
+        with self._lock:
+            utterance = self._current
+        if utterance is not None:
+            utterance.cancelled.set()
+        return utterance
+
+    def duck(self, gain):
+        with self._lock:
+            utterance = self._current
+        if utterance is not None:
+            utterance.gain = gain
+        return utterance
+
+    def playback_level(self, half_life=0.1):
+        # RMS of the last chunk written, decayed so the tail of a sentence still counts as echo for a moment.
+        return self._level * 0.5 ** ((time.time() - self._level_time) / half_life)
+
+    def close(self):
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+        # Without running threads a sentinel would sit in the queue and stop the next start() straight away.
+        if not threads:
+            return
+        self._synthesis_queue.put(None)
+        for thread in threads:
+            thread.join(timeout=5)
+
+    def _synthesize_loop(self):
+        while True:
+            item = self._synthesis_queue.get()
+            if item is None:
+                self._playback_queue.put(None)
+                return
+
+            utterance, sentence, audio_content = item
+            if sentence is not None and utterance.cancelled.is_set():
+                continue
+            if sentence is not None:
+                try:
+                    audio_content = self.speaker.synthesize(sentence)
+                except Exception as e:
+                    print(f"Error synthesizing '{sentence}': {e}")
+                    continue
+            self._playback_queue.put((utterance, audio_content))
+
+    def _playback_loop(self):
+        while True:
+            item = self._playback_queue.get()
+            if item is None:
+                self._close_stream()
+                return
+
+            utterance, audio_content = item
+            if audio_content is None:
+                try:
+                    self.speaker.finish_utterance(utterance)
+                except Exception as e:
+                    print(f"Error finishing utterance: {e}")
+                finally:
+                    # Waiters are released whatever happens, or every later wait() would hang.
+                    utterance.done.set()
+                continue
+            if utterance.cancelled.is_set():
+                continue
+
+            try:
+                self._write(utterance, audio_content)
+            except Exception as e:
+                print(f"Error playing audio: {e}")
+
+    @tracer.traced('speaker.play')
+    def _write(self, utterance, audio_content):
+        with wave.open(BytesIO(audio_content), 'rb') as wf:
+            stream_format = (wf.getsampwidth(), wf.getnchannels(), wf.getframerate())
+            frames = memoryview(wf.readframes(wf.getnframes()))
+
+        if stream_format != self._stream_format:
+            self._close_stream()
+            sample_width, channels, rate = stream_format
+            self._stream = self.speaker.p.open(format=self.speaker.p.get_format_from_width(sample_width),
+                                               channels=channels,
+                                               rate=rate,
+                                               output=True)
+            self._stream_format = stream_format
+
+        if self.speaker.save_output:
+            utterance.format = stream_format
+            utterance.frames.append(bytes(frames))
+
+        sample_width, channels, _ = stream_format
+        step = self.speaker.chunk * sample_width * channels
+        for start in range(0, len(frames), step):
+            if utterance.cancelled.is_set():
+                break
+            chunk = frames[start:start + step]
+            if sample_width == 2:
+                samples = np.frombuffer(chunk, dtype=np.int16)
+                if utterance.gain != 1.0:
+                    samples = (samples * utterance.gain).astype(np.int16)
+                    chunk = samples.tobytes()
+                self._level = float(np.sqrt(np.mean(samples.astype(np.float32) ** 2))) if len(samples) else 0.0
+                self._level_time = time.time()
+            self._stream.write(chunk)
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+            self._stream_format = None
 
 class SpeakerModule:
     def __init__(self, credentials_path='./resources/gcp_speech_and_text_credentials.json'):
-        self.tts_client = texttospeech.TextToSpeechClient.from_service_account_json(credentials_path)
+        self.credentials_path = credentials_path
         self.tts_output_filename = "tts_output.wav"
-        self.p = pyaudio.PyAudio()
+        self.save_output = False
         self.chunk = 1024
+        self.cache = TTSCache()
+        self.engine = PlaybackEngine(self)
 
-    def synthesize_speech(self, text):
-        input_text = texttospeech.SynthesisInput(text=text)
-
-        voice = texttospeech.VoiceSelectionParams(
+        self.voice = texttospeech.VoiceSelectionParams(
             language_code="en-US",
             name="en-US-Wavenet-F",
             ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
         )
 
-        audio_config = texttospeech.AudioConfig(
+        self.audio_config = texttospeech.AudioConfig(
             audio_encoding=texttospeech.AudioEncoding.LINEAR16
         )
 
+    @property
+    def tts_client(self):
+        return registry.get('tts_client', self.credentials_path)
+
+    @property
+    def p(self):
+        return registry.get('pyaudio')
+
+    @tracer.traced('speaker.synthesize')
+    def synthesize(self, text):
+        key = TTSCache.key(text, self.voice, self.audio_config)
+        audio_content = self.cache.get(key)
+        if audio_content is not None:
+            return audio_content
+
+        input_text = texttospeech.SynthesisInput(text=text)
+
         response = self.tts_client.synthesize_speech(
-            input=input_text, voice=voice, audio_config=audio_config
+            input=input_text, voice=self.voice, audio_config=self.audio_config
         )
 
-        with open(self.tts_output_filename, 'wb') as out:
-            out.write(response.audio_content)
+        self.cache.put(key, response.audio_content)
+        return response.audio_content
 
-        self.play(self.tts_output_filename)
+    def speak(self, text):
+        return self.engine.speak(text)
 
-    def play(self, filename):
-        wf = wave.open(filename, 'rb')
-
-        stream = self.p.open(format=self.p.get_format_from_width(wf.getsampwidth()),
-                             channels=wf.getnchannels(),
-                             rate=wf.getframerate(),
-                             output=True)
+    def speak_stream(self, chunks):
+        return self.engine.speak_stream(chunks)
 
-        data = wf.readframes(self.chunk)
+    @tracer.traced('speaker.synthesize_speech')
+    def synthesize_speech(self, text):
+        self.speak(text).wait()
 
-        while data != b'':
-            stream.write(data)
-            data = wf.readframes(self.chunk)
+    def finish_utterance(self, utterance):
+        if self.save_output and utterance.frames:
+            sample_width, channels, rate = utterance.format
+            with wave.open(self.tts_output_filename, 'wb') as wf:
+                wf.setsampwidth(sample_width)
+                wf.setnchannels(channels)
+                wf.setframerate(rate)
+                wf.writeframes(b''.join(utterance.frames))
 
         print("* done speaking")
         print("-----")
+        utterance.done.set()
 
-        stream.stop_stream()
-        stream.close()
+    def prewarm(self, phrases):
+        def warm():
+            for phrase in phrases:
+                for sentence in split_sentences(phrase):
+                    try:
+                        self.synthesize(sentence)
+                    except Exception as e:
+                        print(f"Error prewarming TTS phrase '{sentence}': {e}")
 
-        wf.close()
+        thread = Thread(target=warm, daemon=True)
+        thread.start()
+        return thread
 
-    def delete_tts_output(self):
-        try:
-            if os.path.exists(self.tts_output_filename):
-                os.remove(self.tts_output_filename)
-                print(f"Deleted TTS output file: {self.tts_output_filename}")
-            else:
-                print(f"TTS output file not found: {self.tts_output_filename}")
-        except Exception as e:
-            print(f"Error deleting TTS output file: {str(e)}")
+    def play(self, filename):
+        with open(filename, 'rb') as audio_file:
+            self.play_audio(audio_file.read())
+
+    def play_audio(self, audio_content):
+        self.engine.play(audio_content).wait()
+
+    def interrupt(self):
+        return self.engine.interrupt()
+
+    def duck(self, gain=0.2):
+        return self.engine.duck(gain)
+
+    def playback_level(self):
+        return self.engine.playback_level()
+
+    def close(self):
+        self.engine.close()
 #
 #
 #
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('pyaudio')
+from audio_capture_module import PCMRingBuffer
+from fake_backends import FakePyAudio
+from microphone_module import MicrophoneModule
+from registry_module import registry
+
+def test_writes_are_mirrored_so_any_window_is_contiguous():
+    ring = PCMRingBuffer(8)
+    ring.write(np.arange(6, dtype=np.int16))
+    ring.write(np.arange(6, 10, dtype=np.int16))
+
+    assert ring.written == 10
+    assert ring.oldest() == 2
+    # Samples 2-9 wrap around the end of the ring but still come back as one slice.
+    assert ring.view(2, 10).tolist() == list(range(2, 10))
+    assert ring._samples[:8].tolist() == ring._samples[8:].tolist()
+
+def test_write_larger_than_capacity_keeps_the_newest_samples():
+    ring = PCMRingBuffer(4)
+    ring.write(np.arange(3, dtype=np.int16))
+    ring.write(np.arange(100, 110, dtype=np.int16))
+
+    assert ring.written == 13
+    assert ring.oldest() == 9
+    assert ring.view(9, 13).tolist() == [106, 107, 108, 109]
+
+def test_views_are_read_only():
+    ring = PCMRingBuffer(4)
+    ring.write(np.arange(4, dtype=np.int16))
+
+    with pytest.raises(ValueError):
+        ring.view(0, 2)[0] = 7
+
+@pytest.mark.parametrize('start, end', [(1, 4), (4, 11), (3, 8)])
+def test_views_outside_the_buffer_are_refused(start, end):
+    ring = PCMRingBuffer(4)
+    ring.write(np.arange(10, dtype=np.int16))
+
+    with pytest.raises(ValueError):
+        ring.view(start, end)
+
+class EagerPyAudio(FakePyAudio):
+    # PortAudio can run the callback before start_stream returns; this one always does.
+    def open(self, *args, stream_callback=None, **kwargs):
+        stream = super().open(*args, stream_callback=stream_callback, **kwargs)
+        start_stream = stream.start_stream
+
+        def start_eagerly():
+            stream.callback(stream.source.read(stream.frames_per_buffer), stream.frames_per_buffer, {}, 0)
+            start_stream()
+        stream.start_stream = start_eagerly
+        return stream
+
+def test_recording_keeps_audio_delivered_while_the_stream_starts():
+    rate = 16000
+    t = np.arange(rate) / rate
+    speech = (sum(np.sin(2 * np.pi * 120 * k * t) / k for k in range(1, 25)) * 3000).astype(np.int16)
+    registry.provide('pyaudio', EagerPyAudio([speech.tobytes()], speed=20))
+    microphone = MicrophoneModule()
+    try:
+        audio = microphone.record()
+    finally:
+        microphone.close()
+        registry.close()
+
+    assert audio[:rate].tolist() == speech.tolist()
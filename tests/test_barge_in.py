@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+pytest.importorskip('pyaudio')
+from barge_in_module import BargeInMonitor
+from fake_backends import FakePyAudio
+from microphone_module import MicrophoneModule
+from orchestrator_module import ConversationOrchestrator
+from registry_module import registry
+
+RATE = 16000
+
+class FakeSpeaker:
+    def __init__(self, level=0.0):
+        self.level = level
+        self.calls = []
+
+    def playback_level(self):
+        return self.level
+
+    def interrupt(self):
+        self.calls.append('interrupt')
+
+    def duck(self, gain):
+        self.calls.append(('duck', gain))
+
+def voiced(seconds):
+    t = np.arange(int(RATE * seconds)) / RATE
+    return (sum(np.sin(2 * np.pi * 120 * k * t) / k for k in range(1, 25)) * 3000).astype(np.int16)
+
+@pytest.fixture
+def microphone():
+    # Half a second of silence, then the user starts talking; played through a callback stream like PortAudio's.
+    audio = np.concatenate([np.zeros(RATE // 2, dtype=np.int16), voiced(1.0)])
+    registry.provide('pyaudio', FakePyAudio([audio.tobytes()], speed=5))
+    m = MicrophoneModule()
+    m.capture.start()
+    yield m
+    m.close()
+    registry.close()
+
+def watch(monitor, seconds=2.0):
+    stop = threading.Event()
+    timer = threading.Timer(seconds, stop.set)
+    timer.start()
+    try:
+        return monitor.watch(stop)
+    finally:
+        timer.cancel()
+
+def test_speech_stops_playback_and_marks_where_the_user_started(microphone):
+    speaker = FakeSpeaker()
+
+    position = watch(BargeInMonitor(microphone, speaker))
+
+    assert speaker.calls == ['interrupt']
+    # Speech starts at 0.5 s and the turn keeps 0.3 s of pre-roll before it.
+    assert position == pytest.approx(0.2 * RATE, abs=microphone.chunk)
+
+def test_duck_mode_only_turns_playback_down(microphone):
+    speaker = FakeSpeaker()
+
+    assert watch(BargeInMonitor(microphone, speaker, mode='duck', duck_gain=0.3)) is not None
+
+    assert speaker.calls == [('duck', 0.3)]
+
+def test_speech_quieter_than_playback_is_taken_for_echo(microphone):
+    speaker = FakeSpeaker(level=20000)
+
+    assert watch(BargeInMonitor(microphone, speaker), seconds=0.5) is None
+    assert speaker.calls == []
+
+class SlowUtterance:
+    def __init__(self):
+        self.text = "What did you do today?"
+        self.finished = threading.Event()
+
+    def wait(self):
+        self.finished.wait(timeout=5)
+
+def test_ducked_question_keeps_playing_while_the_answer_is_recorded():
+    utterance = SlowUtterance()
+    conversation = SimpleNamespace(
+        duplex=True,
+        speaker=SimpleNamespace(speak_stream=lambda chunks: utterance),
+        ioanna=SimpleNamespace(stream_question=lambda user, fallback: iter(())),
+        barge_in=SimpleNamespace(watch=lambda stop: 4800),
+        new_message=SimpleNamespace(emit=lambda message: None),
+    )
+    orchestrator = ConversationOrchestrator(conversation)
+
+    async def turn():
+        speaking, barge_in = await orchestrator.ask(None)
+        playing = not speaking.done()
+        utterance.finished.set()
+        return playing, barge_in, await speaking
+
+    orchestrator.executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        assert asyncio.run(turn()) == (True, 4800, "What did you do today?")
+    finally:
+        orchestrator.executor.shutdown(wait=True)
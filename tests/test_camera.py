@@ -0,0 +1,89 @@
+import time
+import numpy as np
+import pytest
+from threading import Thread
+
+pytest.importorskip('cv2')
+dlib = pytest.importorskip('dlib')
+from camera_module import CameraModule
+from registry_module import FACE_RECOGNITION_MODEL, SHAPE_PREDICTOR, registry
+
+class RecordingDetector:
+    # Finds one face in the middle of whatever image it is given and remembers the image sizes.
+    def __init__(self):
+        self.shapes = []
+        self.faces = True
+
+    def __call__(self, image):
+        self.shapes.append(image.shape)
+        if not self.faces:
+            return []
+        height, width = image.shape
+        return [dlib.rectangle(width // 4, height // 4, width // 2, height // 2)]
+
+class CentreShape:
+    def __call__(self, gray, box):
+        return dlib.full_object_detection(box, [box.center()] * 68)
+
+class MarkerRecognizer:
+    # Uses each frame's top-left pixel as its "descriptor" so tests can tell which frames were picked.
+    def compute_face_descriptor(self, frames, shapes):
+        return [[[float(frame[0, 0, 0])]] for frame in frames]
+
+def face_frame(marker, noise):
+    frame = np.full((480, 640, 3), 128, dtype=np.uint8)
+    frame[120:240, 160:320] = np.random.default_rng(marker).integers(128 - noise, 128 + noise + 1, size=(120, 160, 3))
+    frame[0, 0] = marker
+    return frame
+
+@pytest.fixture
+def detector():
+    detector = RecordingDetector()
+    registry.provide('face_detector', detector)
+    yield detector
+    registry.close()
+
+def test_small_frames_are_searched_at_full_resolution(detector):
+    camera = CameraModule()
+
+    box = camera.locate_face(np.zeros((480, 640), dtype=np.uint8))
+
+    assert detector.shapes == [(480, 640)]
+    assert (box.left(), box.top(), box.right(), box.bottom()) == (160, 120, 320, 240)
+
+def test_large_frames_keep_the_smallest_wanted_face_detectable(detector):
+    camera = CameraModule()
+    camera.locate_face(np.zeros((720, 1280), dtype=np.uint8))
+
+    camera.min_face_size = 160
+    box = camera.locate_face(np.zeros((720, 1280), dtype=np.uint8))
+
+    # At 80 px faces the HOG window rules out any shrinking; at 160 px the frame can be halved.
+    assert detector.shapes == [(720, 1280), (360, 640)]
+    assert (box.left(), box.top(), box.right(), box.bottom()) == (320, 180, 640, 360)
+
+def test_descriptors_fall_back_to_the_sharpest_faces(detector):
+    registry.provide('shape_predictor', CentreShape(), SHAPE_PREDICTOR)
+    registry.provide('face_recognition_model', MarkerRecognizer(), FACE_RECOGNITION_MODEL)
+    camera = CameraModule()
+    camera.tracking = False
+    camera.min_face_sharpness = 1e9
+
+    def publish():
+        for marker, noise in ((1, 2), (2, 20), (3, 0), (4, 10)):
+            camera.frame_buffer.publish(face_frame(marker, noise), time.time())
+            time.sleep(0.05)
+
+    publisher = Thread(target=publish)
+    publisher.start()
+    descriptors = camera.collect_face_descriptors(count=2, timeout=0.5)
+    publisher.join()
+
+    assert descriptors[:, 0].tolist() == [2, 4]
+
+def test_no_face_gives_no_descriptors(detector):
+    camera = CameraModule()
+    camera.tracking = False
+    detector.faces = False
+
+    assert camera.collect_face_descriptors(count=2, timeout=0.2) is None
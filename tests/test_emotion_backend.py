@@ -0,0 +1,84 @@
+import os
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+from emotion_backend_module import EMOTIONS, LocalEmotionBackend, likelihood
+from emotion_model_module import FER_LABELS, max_pool, same_padding
+from registry_module import EMOTION_MODEL, SHAPE_PREDICTOR, registry
+
+class Analysis:
+    def __init__(self, landmarks):
+        self.gray = np.full((240, 320), 128, dtype=np.uint8)
+        self.landmarks = landmarks
+
+class LandmarkCamera:
+    def face_landmarks(self, analysis):
+        return analysis.landmarks
+
+def face():
+    points = np.zeros((68, 2), dtype=np.float32)
+    points[36:42] = (140, 100)
+    points[42:48] = (180, 100)
+    return points
+
+class FixedModel:
+    def __init__(self, probabilities):
+        self.probabilities = probabilities
+        self.batches = []
+
+    def predict(self, faces):
+        self.batches.append(faces.shape)
+        return np.tile(self.probabilities, (len(faces), 1))
+
+class BrokenModel:
+    def predict(self, faces):
+        raise OSError("no model file")
+
+def backend(model, path):
+    registry.provide('emotion_model', model, path)
+    return LocalEmotionBackend(LandmarkCamera(), model_path=path)
+
+def test_probabilities_map_onto_likelihoods():
+    assert [likelihood(p) for p in (0.0, 0.1, 0.3, 0.5, 0.75, 1.0)] == [1, 2, 3, 4, 5, 5]
+
+def test_padding_and_pooling_follow_tensorflow():
+    assert same_padding(64, 3, 1) == (1, 1)
+    assert same_padding(60, 3, 2) == (0, 1)
+
+    x = -np.arange(16, dtype=np.float32).reshape(1, 4, 4, 1)
+    pooled = max_pool(x)
+
+    assert pooled.shape == (1, 2, 2, 1)
+    assert pooled[0, :, :, 0].tolist() == [[0, -2], [-8, -10]]
+
+def test_faces_are_classified_in_one_batch():
+    probabilities = np.zeros(len(FER_LABELS), dtype=np.float32)
+    probabilities[FER_LABELS.index('happy')] = 0.9
+    probabilities[FER_LABELS.index('surprise')] = 0.1
+    model = FixedModel(probabilities)
+    emotions = backend(model, 'fixed').detect_batch([Analysis(face()), Analysis(None), Analysis(face())])
+
+    assert model.batches == [(2, 64, 64)]
+    assert emotions[1] is None
+    assert emotions[0] == emotions[2] == {'anger': 1, 'joy': 5, 'sorrow': 1, 'surprise': 2}
+
+def test_model_errors_give_no_result():
+    assert backend(BrokenModel(), 'broken').detect_batch([Analysis(face())]) == [None]
+
+@pytest.mark.skipif(not (os.path.exists(EMOTION_MODEL) and os.path.exists(SHAPE_PREDICTOR)), reason="needs the emotion and landmark models in ./resources")
+def test_smiling_face_reads_as_joy():
+    pytest.importorskip('dlib')
+    pytest.importorskip('h5py')
+    data = pytest.importorskip('skimage.data')
+    from camera_module import CameraModule
+
+    camera = CameraModule(emotion_backend='local')
+    camera.tracking = False
+    frame = cv2.cvtColor(data.astronaut(), cv2.COLOR_RGB2BGR)
+
+    [(emotions, timestamp)] = camera.detect_emotions([(None, 1.0, frame)])
+
+    assert timestamp == 1.0
+    assert emotions['joy'] == 5
+    assert all(emotions[emotion] <= 2 for emotion in EMOTIONS if emotion != 'joy')
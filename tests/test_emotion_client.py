@@ -0,0 +1,59 @@
+import time
+import pytest
+from emotion_client_module import AudioEmotionClient
+from fake_backends import FakeEmotionServer, silent_wav
+
+@pytest.fixture
+def server():
+    server = FakeEmotionServer(emotion='sad', confidence=0.7).start()
+    yield server
+    server.stop()
+
+def test_detect_returns_emotion(server):
+    client = AudioEmotionClient(api_url=server.url)
+    try:
+        assert client.detect(silent_wav(0.1)) == {'emotion': 'sad', 'confidence': 0.7}
+    finally:
+        client.close()
+
+def test_detect_many_runs_segments_concurrently(server):
+    server.latency = 0.2
+    client = AudioEmotionClient(api_url=server.url, max_workers=4)
+    try:
+        start = time.perf_counter()
+        results = client.detect_many([silent_wav(0.1)] * 4)
+        elapsed = time.perf_counter() - start
+    finally:
+        client.close()
+
+    assert results == [{'emotion': 'sad', 'confidence': 0.7}] * 4
+    assert server.requests == 4
+    # One round trip for all four, not four in a row.
+    assert elapsed < 0.6
+
+def test_detect_times_out_to_unknown(server):
+    server.latency = 0.5
+    client = AudioEmotionClient(api_url=server.url, timeout=(1, 0.1))
+    try:
+        start = time.perf_counter()
+        result = client.detect(silent_wav(0.1))
+        elapsed = time.perf_counter() - start
+    finally:
+        client.close()
+
+    assert result['emotion'] == 'unknown'
+    assert result['confidence'] == 0.0
+    assert 'error' in result
+    assert elapsed < 0.5
+
+def test_detect_error_status_is_unknown(server):
+    server.status_code = 500
+    client = AudioEmotionClient(api_url=server.url)
+    try:
+        result = client.detect(silent_wav(0.1))
+    finally:
+        client.close()
+
+    assert result['emotion'] == 'unknown'
+    assert result['confidence'] == 0.0
+    assert '500' in result['error']
@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+import pytest
+from endpointing_module import Endpointer, looks_complete
+
+FRAME = 0.03
+
+def feed(endpointer, *runs):
+    # runs are (is_speech, seconds); returns True as soon as the endpointer ends the turn.
+    for is_speech, seconds in runs:
+        for _ in range(round(seconds / FRAME)):
+            if endpointer.update(is_speech):
+                return True
+    return False
+
+def partial(transcript, is_final=True):
+    return SimpleNamespace(transcript=transcript, is_final=is_final)
+
+def test_turn_ends_after_the_initial_silence_threshold():
+    endpointer = Endpointer(frame_duration=FRAME, early_commit=False)
+
+    assert not feed(endpointer, (True, 1.0), (False, 0.9))
+    assert feed(endpointer, (False, 0.2))
+
+    assert endpointer.result['reason'] == 'silence'
+    assert endpointer.result['endpoint_latency'] == pytest.approx(1.0, abs=FRAME)
+    assert endpointer.result['threshold'] == 1.0
+
+def test_finished_sentence_commits_early():
+    endpointer = Endpointer(frame_duration=FRAME)
+    feed(endpointer, (True, 1.0))
+    endpointer.partial(partial("I went hiking today."))
+
+    assert feed(endpointer, (False, 1.0))
+
+    assert endpointer.result['reason'] == 'early_commit'
+    assert endpointer.result['endpoint_latency'] == pytest.approx(0.35, abs=FRAME)
+
+@pytest.mark.parametrize('result', [
+    partial("I went hiking today.", is_final=False),
+    partial("I went hiking and"),
+    partial("I went hiking with the."),
+])
+def test_unfinished_sentences_wait_for_silence(result):
+    endpointer = Endpointer(frame_duration=FRAME)
+    feed(endpointer, (True, 1.0))
+    endpointer.partial(result)
+
+    assert not looks_complete(result)
+    assert feed(endpointer, (False, 1.5))
+    assert endpointer.result['reason'] == 'silence'
+
+def test_no_speech_times_out():
+    endpointer = Endpointer(frame_duration=FRAME, no_speech_timeout=2.0)
+
+    assert not feed(endpointer, (False, 1.9))
+    assert feed(endpointer, (False, 0.2))
+
+    assert endpointer.result['reason'] == 'no_speech'
+    assert endpointer.result['endpoint_latency'] == 0.0
+
+def test_endless_speech_stops_at_max_duration():
+    endpointer = Endpointer(frame_duration=FRAME, max_duration=3.0)
+
+    assert feed(endpointer, (True, 3.1))
+
+    assert endpointer.result['reason'] == 'max_duration'
+    assert endpointer.result['duration'] == pytest.approx(3.0, abs=FRAME)
+
+def test_single_speech_frames_do_not_start_a_turn():
+    endpointer = Endpointer(frame_duration=FRAME, no_speech_timeout=1.0)
+
+    assert feed(endpointer, *[(True, FRAME), (False, 0.15)] * 10)
+    assert endpointer.result['reason'] == 'no_speech'
+
+def test_threshold_adapts_to_the_speakers_pauses():
+    endpointer = Endpointer(frame_duration=FRAME, early_commit=False)
+    # Five turns with a 0.6 s pause mid-answer each, short enough to sit through with the initial 1 s threshold.
+    for _ in range(5):
+        endpointer.reset()
+        assert not feed(endpointer, (True, 0.5), (False, 0.6), (True, 0.5))
+        assert feed(endpointer, (False, 2.0))
+        assert endpointer.result['pauses'] == 1
+
+    endpointer.reset()
+
+    # The 90th percentile pause plus a 25 % margin; the recorded pause includes the smoothing hangover.
+    assert endpointer.threshold == pytest.approx(endpointer.silence_threshold())
+    assert 0.6 * 1.25 <= endpointer.threshold < 1.0
+    assert feed(endpointer, (True, 0.5), (False, 1.0))
+    assert endpointer.result['endpoint_latency'] < 1.0
+
+def test_threshold_stays_within_bounds():
+    endpointer = Endpointer(frame_duration=FRAME)
+    endpointer.pauses.extend([5.0] * 10)
+    assert endpointer.silence_threshold() == endpointer.max_silence
+
+    endpointer.pauses.clear()
+    endpointer.pauses.extend([0.15] * 10)
+    assert endpointer.silence_threshold() == endpointer.min_silence
+
+def test_summary_reports_reasons_and_latency():
+    endpointer = Endpointer(frame_duration=FRAME, early_commit=False, no_speech_timeout=1.0)
+    feed(endpointer, (True, 0.5), (False, 2.0))
+    endpointer.reset()
+    feed(endpointer, (False, 2.0))
+
+    summary = endpointer.summary()
+
+    assert summary['turns'] == 2
+    assert summary['reasons'] == {'silence': 1, 'no_speech': 1}
+    assert summary['p50_latency_ms'] == pytest.approx(1000, abs=FRAME * 1000)
@@ -0,0 +1,65 @@
+import mongomock
+import numpy as np
+import pytest
+from face_index_module import FaceIndex
+
+def encoding(*values):
+    vector = np.zeros(128, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector.tolist()
+
+@pytest.fixture
+def users():
+    return mongomock.MongoClient().ioanna.users
+
+def test_empty_gallery_matches_nobody(users):
+    index = FaceIndex(users)
+    index.load()
+
+    assert len(index) == 0
+    assert index.match(encoding(0.1)) == (None, None)
+
+def test_match_picks_the_nearest_user_under_the_threshold(users):
+    users.insert_many([
+        {'_id': 'far', 'face_encoding': encoding(0.5)},
+        {'_id': 'near', 'face_encoding': encoding(0.2)},
+        {'_id': 'nearest', 'face_encoding': encoding(0.0, 0.3), 'face_exemplars': [encoding(0.1)]},
+        {'_id': 'no_face', 'user_name': 'Anna'},
+    ])
+    index = FaceIndex(users)
+    index.load()
+
+    # Every stored face is under 0.6 away; the first one under the threshold is not the answer.
+    user_id, distance = index.match(encoding(0.12))
+    assert user_id == 'nearest'
+    assert distance == pytest.approx(0.02, abs=1e-5)
+    assert len(index) == 4
+
+def test_match_rejects_faces_past_the_threshold(users):
+    users.insert_one({'_id': 'someone', 'face_encoding': encoding(1.0)})
+    index = FaceIndex(users)
+    index.load()
+
+    user_id, distance = index.match(encoding(0.0))
+    assert user_id is None
+    assert distance == pytest.approx(1.0)
+
+def test_add_grows_past_the_initial_capacity(users):
+    index = FaceIndex(users)
+    index.load()
+    for i in range(100):
+        index.add(i, encoding(float(i)))
+
+    assert len(index) == 100
+    # Float32 distances from the expanded form are only good to a few decimals at these norms.
+    assert index.match(encoding(70.1)) == (70, pytest.approx(0.1, abs=0.01))
+    assert index.match(encoding(3.0, 0.2))[0] == 3
+
+def test_load_replaces_what_was_added(users):
+    index = FaceIndex(users)
+    index.add('stale', encoding(0.0))
+    users.insert_one({'_id': 'stored', 'face_encoding': encoding(0.0)})
+    index.load()
+
+    assert len(index) == 1
+    assert index.match(encoding(0.0))[0] == 'stored'
@@ -0,0 +1,31 @@
+import time
+from fake_backends import FakeMongoClient
+from persistence_module import PersistenceQueue
+
+def test_fake_mongo_takes_the_persistence_path():
+    db = FakeMongoClient().ioanna
+    db.users.insert_many([{'_id': 1, 'user_name': 'Maria'}])
+    persistence = PersistenceQueue(flush_interval=0.01)
+    persistence.insert(db.memories, {'user_id': 1, 'question': 'q'})
+    persistence.insert(db.memories, {'_id': 2, 'user_id': 1, 'question': 'first'})
+    persistence.insert(db.memories, {'_id': 2, 'user_id': 1, 'question': 'again'})
+    persistence.update(db.users, {'_id': 1}, {'$set': {'seen': True}})
+
+    try:
+        assert persistence.flush(timeout=5)
+    finally:
+        persistence.close()
+    assert db.memories.count_documents({'user_id': 1}) == 2
+    assert db.memories.find_one({'_id': 2})['question'] == 'first'
+    assert db.users.find_one({'_id': 1}, {'_id': 0}) == {'user_name': 'Maria', 'seen': True}
+
+def test_fake_mongo_delays_round_trips():
+    users = FakeMongoClient(latency=0.05).ioanna.users
+
+    start = time.perf_counter()
+    users.insert_many([{'_id': 1}])
+    list(users.find({}))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed >= 0.1
+    assert users.name == 'users' and users.database.name == 'ioanna'
@@ -0,0 +1,40 @@
+from frame_buffer_module import FrameBuffer
+
+def buffer_with(timestamps, size=90):
+    buffer = FrameBuffer(size)
+    for timestamp in timestamps:
+        buffer.publish(f"frame at {timestamp}", timestamp)
+    return buffer
+
+def test_closest_returns_the_frame_nearest_the_timestamp():
+    buffer = buffer_with([10.0, 10.1, 10.2, 10.3])
+
+    assert buffer.closest(10.12) == (2, 10.1, "frame at 10.1")
+    assert buffer.closest(10.27)[1] == 10.3
+    assert buffer.closest(50.0)[1] == 10.3
+
+def test_closest_respects_the_tolerance():
+    buffer = buffer_with([10.0, 10.5])
+
+    assert buffer.closest(10.2, tolerance=0.25)[1] == 10.0
+    assert buffer.closest(11.0, tolerance=0.25) is None
+    assert FrameBuffer().closest(10.0) is None
+
+def test_between_is_inclusive_and_in_order():
+    buffer = buffer_with([1.0, 2.0, 3.0, 4.0])
+
+    assert [timestamp for _, timestamp, _ in buffer.between(2.0, 3.5)] == [2.0, 3.0]
+    assert buffer.between(5.0, 6.0) == []
+
+def test_lookups_only_see_frames_still_in_the_ring():
+    buffer = buffer_with([1.0, 2.0, 3.0, 4.0], size=2)
+
+    assert buffer.closest(1.0)[1] == 3.0
+    assert buffer.closest(1.0, tolerance=0.5) is None
+    assert [sequence for sequence, _, _ in buffer.between(0.0, 10.0)] == [3, 4]
+
+def test_wait_for_next_returns_newer_frames_only():
+    buffer = buffer_with([1.0, 2.0])
+
+    assert buffer.wait_for_next(1, timeout=0.01)[0] == 2
+    assert buffer.wait_for_next(2, timeout=0.01) is None
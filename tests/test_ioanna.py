@@ -0,0 +1,59 @@
+import json
+import pytest
+from fake_backends import FakeMistralServer
+from ioanna_module import Ioanna
+
+USER = {'user_name': 'Maria'}
+
+def delta(content):
+    return json.dumps({'choices': [{'index': 0, 'delta': {'content': content}}]})
+
+@pytest.fixture
+def server():
+    server = FakeMistralServer(reply="Hi Maria! How was your day? Did you sleep well").start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def ioanna(server):
+    ioanna = Ioanna(api_key='test')
+    ioanna.api_url = server.url
+    yield ioanna
+    ioanna.session.close()
+
+def test_stream_question_yields_whole_sentences(ioanna):
+    sentences = list(ioanna.stream_question(USER))
+
+    assert sentences == ["Hi Maria!", "How was your day?", "Did you sleep well"]
+    assert ioanna.conversation_history.get_history() == [
+        {'role': 'assistant', 'content': "Hi Maria! How was your day? Did you sleep well"},
+    ]
+
+def test_stream_question_stops_at_done(ioanna, server):
+    server.events = [delta("Where did "), delta("you grow up? "), "[DONE]", delta("Ignored.")]
+
+    assert list(ioanna.stream_question(USER)) == ["Where did you grow up?"]
+    assert ioanna.conversation_history.get_history()[-1]['content'] == "Where did you grow up?"
+
+def test_stream_question_decodes_raw_utf8(ioanna, server):
+    content = json.dumps({'choices': [{'index': 0, 'delta': {'content': "Olá José! Comment ça va, Zoë?"}}]}, ensure_ascii=False)
+    server.events = [content, "[DONE]"]
+
+    assert list(ioanna.stream_question(USER)) == ["Olá José!", "Comment ça va, Zoë?"]
+
+def test_stream_question_skips_malformed_events(ioanna, server):
+    server.events = [delta("What is "), "{not json", json.dumps({'choices': []}), json.dumps({'id': 1}), delta("your favourite food?"), "[DONE]"]
+
+    assert list(ioanna.stream_question(USER)) == ["What is your favourite food?"]
+
+def test_stream_question_falls_back_when_nothing_arrives(ioanna, server):
+    server.status_code = 503
+
+    assert list(ioanna.stream_question(USER, fallback="Tell me more.")) == ["Tell me more."]
+    assert ioanna.conversation_history.get_history() == [{'role': 'assistant', 'content': "Tell me more."}]
+
+def test_stream_question_without_fallback_records_nothing(ioanna, server):
+    server.events = ["[DONE]"]
+
+    assert list(ioanna.stream_question(USER)) == []
+    assert ioanna.conversation_history.get_history() == []
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from emotion_client_module import AudioEmotionClient
+from fake_backends import FakeEmotionServer
+from recognizer_module import StubRecognizer
+
+pytest.importorskip('pyaudio')
+from microphone_module import MicrophoneModule
+
+@pytest.fixture
+def microphone():
+    server = FakeEmotionServer(emotion='happy', confidence=0.8).start()
+    m = MicrophoneModule()
+    m.emotion_client.close()
+    m.emotion_client = AudioEmotionClient(api_url=server.url)
+    yield m
+    m.emotion_client.close()
+    server.stop()
+
+def test_analyze_splits_audio_on_stub_word_offsets(microphone):
+    microphone.recognizer = StubRecognizer("I like tea. It is warm.")
+    audio = np.arange(3 * microphone.rate, dtype=np.int16)
+
+    result = microphone.transcribe(audio)
+    transcript, analysis = microphone.analyze(audio, result)
+
+    assert transcript == "I like tea. It is warm."
+    assert [sentence for sentence, *_ in analysis] == ["I like tea.", "It is warm."]
+    # Six words evenly over three seconds: each sentence gets half the audio.
+    first, second = analysis[0][1], analysis[1][1]
+    assert len(first) == len(second) == 1.5 * microphone.rate
+    assert first[0] == 0 and second[0] == 1.5 * microphone.rate
+    assert [start_time for *_, start_time in analysis] == [0.0, 1.5]
+    assert all(emotion == {'emotion': 'happy', 'confidence': 0.8} for _, _, _, _, emotion, _ in analysis)
+
+def test_segment_audio_uses_given_word_offsets(microphone):
+    words = [("Hello", 0.0, 0.5), ("there.", 0.5, 1.0), ("Bye", 2.0, 2.5), ("now.", 2.5, 3.0)]
+    microphone.recognizer = StubRecognizer("Hello there. Bye now.", words=words)
+    audio = np.zeros(3 * microphone.rate, dtype=np.int16)
+
+    transcript, analysis = microphone.analyze(audio, microphone.transcribe(audio))
+
+    assert [start_time for *_, start_time in analysis] == [0.0, 2.0]
+    assert [duration for _, _, duration, _, _, _ in analysis] == [1000.0, 1000.0]
@@ -0,0 +1,118 @@
+import mongomock
+import pytest
+from pymongo.errors import AutoReconnect
+from persistence_module import PersistenceQueue, migrate_embedded_memories
+
+@pytest.fixture
+def database():
+    return mongomock.MongoClient().ioanna
+
+@pytest.fixture
+def persistence():
+    persistence = PersistenceQueue(flush_interval=0.05, retries=2)
+    yield persistence
+    persistence.close()
+
+def count_bulk_writes(collection):
+    calls = []
+    bulk_write = collection.bulk_write
+
+    def counted(operations, **kwargs):
+        calls.append(list(operations))
+        return bulk_write(operations, **kwargs)
+    collection.bulk_write = counted
+    return calls
+
+def test_queued_writes_go_out_in_one_batch(database, persistence):
+    calls = count_bulk_writes(database.memories)
+    for i in range(5):
+        persistence.insert(database.memories, {'n': i})
+
+    assert persistence.flush(timeout=5)
+    assert len(calls) == 1
+    assert sorted(document['n'] for document in database.memories.find()) == [0, 1, 2, 3, 4]
+
+def test_back_to_back_sets_are_coalesced(database, persistence):
+    database.users.insert_one({'_id': 1})
+    calls = count_bulk_writes(database.users)
+    persistence.update(database.users, {'_id': 1}, {'$set': {'a': 1}})
+    persistence.update(database.users, {'_id': 1}, {'$set': {'b': 2}})
+    persistence.update(database.users, {'_id': 1}, {'$set': {'a': 3}})
+
+    assert persistence.flush(timeout=5)
+    assert [len(operations) for operations in calls] == [1]
+    assert database.users.find_one({'_id': 1}) == {'_id': 1, 'a': 3, 'b': 2}
+
+def test_duplicate_inserts_are_skipped(database, persistence):
+    database.memories.insert_one({'_id': 1, 'n': 'stored'})
+    persistence.insert(database.memories, {'_id': 1, 'n': 'retried'})
+    persistence.insert(database.memories, {'_id': 2, 'n': 'new'})
+
+    # A duplicate is what a retried insert looks like, so it is not a failure.
+    assert persistence.flush(timeout=5)
+    assert list(database.memories.find().sort('_id')) == [{'_id': 1, 'n': 'stored'}, {'_id': 2, 'n': 'new'}]
+
+def test_transient_errors_are_retried(database, persistence, monkeypatch):
+    monkeypatch.setattr('persistence_module.time.sleep', lambda seconds: None)
+    bulk_write = database.memories.bulk_write
+    attempts = []
+
+    def flaky(operations, **kwargs):
+        attempts.append(len(operations))
+        if len(attempts) < 3:
+            raise AutoReconnect("connection reset")
+        return bulk_write(operations, **kwargs)
+    database.memories.bulk_write = flaky
+    persistence.insert(database.memories, {'n': 1})
+
+    assert persistence.flush(timeout=5)
+    assert attempts == [1, 1, 1]
+    assert database.memories.count_documents({}) == 1
+
+def test_flush_reports_writes_that_were_given_up_on(database, persistence, monkeypatch):
+    monkeypatch.setattr('persistence_module.time.sleep', lambda seconds: None)
+
+    def down(operations, **kwargs):
+        raise AutoReconnect("no primary")
+    database.memories.bulk_write = down
+    persistence.insert(database.memories, {'n': 1})
+
+    assert not persistence.flush(timeout=5)
+    assert [name for name, _ in persistence.failures] == ['memories']
+    # Reported once; later flushes only cover later writes.
+    assert persistence.flush(timeout=5)
+
+def test_flush_fails_when_the_worker_is_gone(database, persistence):
+    persistence.insert(database.memories, {'n': 1})
+    persistence._queue.put(None)
+    persistence._thread.join(5)
+    persistence.insert(database.memories, {'n': 2})
+
+    assert not persistence.flush(timeout=5)
+
+def test_migration_moves_memories_then_unsets(database):
+    database.users.insert_one({'_id': 1, 'memories': [{'question': 'q1', 'answers': ['a1']}, {'question': 'q2'}]})
+    user = database.users.find_one({'_id': 1})
+
+    assert migrate_embedded_memories(database.users, database.memories, user) == 2
+    assert 'memories' not in database.users.find_one({'_id': 1})
+    memories = list(database.memories.find({'user_id': 1}).sort('created_at'))
+    assert [(memory['question'], memory['answers']) for memory in memories] == [('q1', ['a1']), ('q2', [])]
+
+def test_failed_migration_keeps_embedded_memories(database):
+    database.users.insert_one({'_id': 1, 'memories': [{'question': 'q1'}, {'question': 'q2'}]})
+    insert_many = database.memories.insert_many
+
+    def fail_after_first(documents, **kwargs):
+        insert_many(documents[:1], **kwargs)
+        raise AutoReconnect("connection reset")
+    database.memories.insert_many = fail_after_first
+
+    assert migrate_embedded_memories(database.users, database.memories, database.users.find_one({'_id': 1})) == 0
+    assert len(database.users.find_one({'_id': 1})['memories']) == 2
+
+    # The next attempt replaces the half-finished one instead of adding to it.
+    database.memories.insert_many = insert_many
+    assert migrate_embedded_memories(database.users, database.memories, database.users.find_one({'_id': 1})) == 2
+    assert database.memories.count_documents({'user_id': 1}) == 2
+    assert 'memories' not in database.users.find_one({'_id': 1})
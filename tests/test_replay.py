@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+dlib = pytest.importorskip('dlib')
+pytest.importorskip('PyQt5')
+pytest.importorskip('pyaudio')
+from emotion_model_module import FER_LABELS
+from registry_module import EMOTION_MODEL, FACE_RECOGNITION_MODEL, SHAPE_PREDICTOR, registry
+from replay_module import LatencyProfile, Replay, ReplayEmotionClient, Session, recorded_emotions
+from fake_backends import FakeEmotionServer
+
+RATE = 16000
+FACE = [0.1] * 128
+
+class WholeFrameDetector:
+    def __call__(self, image):
+        height, width = image.shape
+        return [dlib.rectangle(width // 4, height // 4, 3 * width // 4, 3 * height // 4)]
+
+class CentreShape:
+    def __call__(self, gray, box):
+        return dlib.full_object_detection(box, [box.center()] * 68)
+
+class SameFace:
+    def compute_face_descriptor(self, frames, shapes):
+        return [[FACE] for _ in frames]
+
+class HappyModel:
+    def predict(self, faces):
+        probabilities = np.zeros((len(faces), len(FER_LABELS)), dtype=np.float32)
+        probabilities[:, FER_LABELS.index('happy')] = 1.0
+        return probabilities
+
+def voiced(seconds):
+    # A buzzy 120 Hz tone that voice activity detection takes for speech.
+    t = np.arange(int(RATE * seconds)) / RATE
+    signal = sum(np.sin(2 * np.pi * 120 * k * t) / k for k in range(1, 25)) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    return (signal / np.abs(signal).max() * 8000).astype(np.int16)
+
+def session():
+    ok, jpeg = cv2.imencode('.jpg', np.random.default_rng(0).integers(0, 255, size=(240, 320, 3), dtype=np.uint8))
+    audio = np.concatenate([np.zeros(RATE // 4, dtype=np.int16), voiced(1.5)])
+    return Session(
+        frames=[(i * 0.1, jpeg.tobytes()) for i in range(60)],
+        turns=[{
+            'audio': audio.tobytes(),
+            'transcript': "I went hiking today. It was lovely, goodbye",
+            'words': [('I', 0.3, 0.4), ('went', 0.4, 0.6), ('hiking', 0.6, 0.9), ('today.', 0.9, 1.1),
+                      ('It', 1.1, 1.2), ('was', 1.2, 1.3), ('lovely,', 1.3, 1.5), ('goodbye', 1.5, 1.7)],
+            'stream_offset': 0.0,
+        }],
+        questions=["What did you do today?"],
+        emotions=[[{'emotion': 'happy', 'confidence': 0.9}, {'emotion': 'calm', 'confidence': 0.7}]],
+        user={'_id': '65f000000000000000000001', 'user_name': 'Maria', 'face_encoding': FACE, 'face_exemplars': [FACE]},
+        memories=[],
+        rate=RATE,
+    )
+
+@pytest.fixture
+def models():
+    registry.provide('face_detector', WholeFrameDetector())
+    registry.provide('shape_predictor', CentreShape(), SHAPE_PREDICTOR)
+    registry.provide('face_recognition_model', SameFace(), FACE_RECOGNITION_MODEL)
+    registry.provide('emotion_model', HappyModel(), EMOTION_MODEL)
+    yield
+    registry.close()
+
+def test_recorded_emotions_are_answered_by_turn_and_segment():
+    with FakeEmotionServer(keyed_responses=recorded_emotions(session())) as server:
+        client = ReplayEmotionClient(server.url)
+        try:
+            results = client.detect_many([b'first', b'second', b'third'])
+        finally:
+            client.close()
+
+    assert [result['emotion'] for result in results] == ['happy', 'calm', 'neutral']
+
+def test_recorded_session_replays_end_to_end(models, tmp_path):
+    path = tmp_path / 'session.zip'
+    session().save(path)
+
+    replay = Replay(Session.load(path), latency=LatencyProfile.none(), speed=4.0)
+    c = replay.run()
+
+    history = c.conversation_history.get_history()
+    assert history[0]['content'] == "What did you do today?"
+    assert history[-1]['content'] == "I went hiking today. It was lovely, goodbye"
+    # Which sentences are kept depends on how many frames landed in each, so only check they came from this turn.
+    [memory] = c.memories_collection.find({})
+    assert memory['question'] == "What did you do today?"
+    assert set(memory['answers']) <= {"I went hiking today.", "It was lovely, goodbye"}
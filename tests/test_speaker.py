@@ -0,0 +1,47 @@
+from fake_backends import FakePyAudio, silent_wav
+from speaker_module import PlaybackEngine
+
+class FakeSpeaker:
+    def __init__(self, save_output=False, fail_finish=False):
+        self.p = FakePyAudio(speed=100)
+        self.chunk = 1024
+        self.save_output = save_output
+        self.fail_finish = fail_finish
+        self.finished = []
+
+    def synthesize(self, sentence):
+        return silent_wav(0.05)
+
+    def finish_utterance(self, utterance):
+        self.finished.append(utterance.text)
+        if self.fail_finish:
+            raise OSError("disk full")
+        utterance.done.set()
+
+def test_speak_plays_every_sentence():
+    speaker = FakeSpeaker()
+    engine = PlaybackEngine(speaker)
+    try:
+        assert engine.speak("Hello there. How are you?").wait(timeout=5)
+    finally:
+        engine.close()
+    assert speaker.finished == ["Hello there. How are you?"]
+
+def test_failed_finish_still_releases_waiters():
+    speaker = FakeSpeaker(save_output=True, fail_finish=True)
+    engine = PlaybackEngine(speaker)
+    try:
+        assert engine.speak("First.").wait(timeout=5)
+        # The playback thread survived and keeps serving later utterances.
+        assert engine.speak("Second.").wait(timeout=5)
+    finally:
+        engine.close()
+    assert speaker.finished == ["First.", "Second."]
+
+def test_close_before_start_leaves_the_engine_usable():
+    engine = PlaybackEngine(FakeSpeaker())
+    engine.close()
+    try:
+        assert engine.speak("Still here.").wait(timeout=5)
+    finally:
+        engine.close()
@@ -0,0 +1,26 @@
+import os
+from tts_cache_module import TTSCache
+
+def test_overwrite_does_not_grow_disk_usage(tmp_path):
+    cache = TTSCache(cache_dir=str(tmp_path))
+    cache.put('first', b'a' * 10)
+    cache.put('first', b'b' * 20)
+    cache.put('second', b'c' * 5)
+
+    assert cache._disk_bytes == cache._scan_disk_usage() == 25
+    assert sorted(os.listdir(tmp_path)) == ['first.wav', 'second.wav']
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    TTSCache(cache_dir=str(tmp_path)).put('phrase', b'audio')
+
+    assert TTSCache(cache_dir=str(tmp_path)).get('phrase') == b'audio'
+
+def test_disk_eviction_keeps_recent_entries(tmp_path):
+    cache = TTSCache(cache_dir=str(tmp_path), max_disk_bytes=25)
+    cache.put('old', b'a' * 10)
+    os.utime(tmp_path / 'old.wav', (1, 1))
+    cache.put('new', b'b' * 10)
+    cache.put('newer', b'c' * 10)
+
+    assert sorted(os.listdir(tmp_path)) == ['new.wav', 'newer.wav']
+    assert cache._disk_bytes == 20
@@ -0,0 +1,199 @@
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+class Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def mark(self, name):
+        # Milliseconds from the start of the span, e.g. time to the first streamed sentence.
+        self.args[name] = round((time.perf_counter() - self.start) * 1000, 1)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.finish(self, time.perf_counter())
+        return False
+
+class NullSpan:
+    def set(self, **args):
+        pass
+
+    def mark(self, name):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Tracer:
+    def __init__(self, enabled=False, output_dir='./traces'):
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.turn = 0
+        self._events = []
+        self._threads = {}
+        self._histograms = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def span(self, name, **args):
+        # Disabled tracing hands back one shared object, so instrumented code pays for a single attribute check.
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def traced(self, name):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with Span(self, name, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def subscribe(self, listener):
+        # Called with (name, seconds) for every finished span, e.g. by a benchmark collecting raw samples.
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def finish(self, span, end):
+        thread = threading.current_thread()
+        event = {
+            'name': span.name,
+            'cat': span.name.split('.', 1)[0],
+            'ph': 'X',
+            'ts': span.start * 1e6,
+            'dur': (end - span.start) * 1e6,
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': span.args,
+        }
+        with self._lock:
+            self._events.append(event)
+            self._threads[thread.ident] = thread.name
+        self.observe(span.name, end - span.start)
+
+    def observe(self, name, seconds):
+        # A latency that is measured rather than timed by a span, such as the silence before an endpoint.
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(name, seconds)
+
+    def begin_turn(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.turn += 1
+            self._events = []
+            self._threads = {}
+
+    def end_turn(self):
+        if not self.enabled:
+            return None
+        with self._lock:
+            events = self._events
+            threads = self._threads
+            turn = self.turn
+            self._events = []
+            self._threads = {}
+        if self.output_dir is None:
+            return None
+
+        pid = os.getpid()
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}} for tid, name in threads.items()]
+        path = os.path.join(self.output_dir, f"turn-{turn:04d}.json")
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(path, 'w') as trace_file:
+                json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, trace_file)
+            with open(os.path.join(self.output_dir, 'metrics.prom'), 'w') as metrics_file:
+                metrics_file.write(self.prometheus())
+        except OSError as e:
+            print(f"Error writing trace for turn {turn}: {str(e)}")
+            return None
+
+        print(f"Turn {turn} trace written to {path}")
+        return path
+
+    def prometheus(self):
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            lines = [
+                "# HELP ioanna_stage_seconds Time spent in each stage of a conversation turn.",
+                "# TYPE ioanna_stage_seconds histogram",
+            ]
+            for stage, histogram in histograms:
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'ioanna_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'ioanna_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'ioanna_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'ioanna_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        # Total seconds and call count per stage, for benchmarks that want numbers rather than a trace file.
+        with self._lock:
+            return {stage: (histogram.sum, histogram.count) for stage, histogram in self._histograms.items()}
+
+    def reset(self):
+        with self._lock:
+            self.turn = 0
+            self._events = []
+            self._threads = {}
+            self._histograms = {}
+
+tracer = Tracer(enabled=os.environ.get('IOANNA_TRACE') == '1')
+#
+#
+#
+#
+#
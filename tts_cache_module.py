@@ -0,0 +1,124 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+
+class TTSCache:
+    def __init__(self, cache_dir='./cache/tts', max_memory_bytes=32 * 1024 * 1024, max_disk_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = Lock()
+        self._disk_bytes = None
+
+    @staticmethod
+    def key(text, voice, audio_config):
+        parts = [
+            text.strip(),
+            voice.language_code,
+            voice.name,
+            str(int(voice.ssml_gender)),
+            str(int(audio_config.audio_encoding)),
+            str(audio_config.sample_rate_hertz),
+            str(audio_config.speaking_rate),
+            str(audio_config.pitch),
+        ]
+        return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                return audio
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cached:
+                audio = cached.read()
+            # Refresh the modification time so disk eviction is least-recently-used too.
+            os.utime(path)
+        except OSError:
+            return None
+
+        self._remember(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        self._remember(key, audio)
+
+        path = self._path(key)
+        temp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # A temp file of its own, so two threads writing the same phrase never share one.
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as out:
+                out.write(audio)
+            with self._lock:
+                try:
+                    replaced = os.path.getsize(path)
+                except OSError:
+                    replaced = 0
+                os.replace(temp_path, path)
+                temp_path = None
+                if self._disk_bytes is None:
+                    self._disk_bytes = self._scan_disk_usage()
+                else:
+                    self._disk_bytes += len(audio) - replaced
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._evict_disk()
+        except OSError as e:
+            print(f"Error writing TTS cache entry: {e}")
+        finally:
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def _remember(self, key, audio):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = audio
+            self._memory_bytes += len(audio)
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.wav'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_disk_usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict_disk(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+#
+#
+#
+#
+#
@@ -2,12 +2,14 @@ from PyQt5.QtCore import Qt, QTimer, pyqtSlot
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QTabWidget, QTextEdit, QScrollArea
 from PyQt5.QtGui import QImage, QPixmap
 from conversation_module import ConversationModule
+from registry_module import STARTUP_RESOURCES, registry
 
 class App(QWidget):
     def __init__(self):
         super().__init__()
         self.conversation_module = ConversationModule()
         self.camera = self.conversation_module.camera
+        self.last_frame_sequence = 0
         self.setWindowTitle("Ioanna-1")
         self.setGeometry(100, 100, 800, 600)
         self.create_widgets()
@@ -44,8 +46,9 @@ class App(QWidget):
         self.update_camera_feed()
 
     def update_camera_feed(self):
-        frame = self.camera.get_current_frame()
-        if frame is not None:
+        entry = self.camera.get_latest_frame()
+        if entry is not None and entry[0] != self.last_frame_sequence:
+            self.last_frame_sequence, _, frame = entry
             height, width, channel = frame.shape
             bytes_per_line = 3 * width
             q_image = QImage(frame.data, width, height, bytes_per_line, QImage.Format_RGB888).rgbSwapped()
@@ -64,6 +67,8 @@ class App(QWidget):
 
     def run(self):
         self.show()
+        # Models load in the background so the window appears straight away.
+        registry.warm_up(STARTUP_RESOURCES)
         self.conversation_module.start()
 #
 #